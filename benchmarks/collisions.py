@@ -0,0 +1,83 @@
+import random
+import timeit
+
+import pygame
+from pygame import Vector2
+
+from src.entities import Bullet
+from src.projectiles import ProjectileStore
+from src.spatial import SpatialHash
+from src.util import get_collisions
+
+
+SIZE = Vector2(240)
+COUNTS = (100, 1000, 10000)
+
+
+class Box:
+    # a stand-in entity: the grid and the linear scan both want a rect
+    __slots__ = ['rect']
+
+    def __init__(self, pos, size=(2, 2)):
+        self.rect = pygame.Rect(0, 0, *size)
+        self.rect.center = pos
+
+
+def make_store(count):
+    store = ProjectileStore(Bullet, count)
+    for _ in range(count):
+        store.spawn((random.random() * SIZE.x, random.random() * SIZE.y),
+                    Vector2(1, 0).rotate(random.random() * 360))
+    return store
+
+
+def best(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    random.seed(0)
+    player = Box(SIZE / 2, (4, 4))
+
+    print(f'{"bullets":>8} {"linear":>10} {"hash":>10} {"hash+build":>11}'
+          f' {"sweep":>10} {"pairs lin":>10} {"pairs hash":>11}  (ms)')
+    for count in COUNTS:
+        store = make_store(count)
+        bullets = [Box(pos) for pos in store.pos[:count].tolist()]
+        grid = SpatialHash(16)
+
+        def build():
+            grid.clear()
+            for bullet in bullets:
+                grid.insert(bullet)
+
+        def linear_pairs():
+            return [
+                (a, b) for i, a in enumerate(bullets)
+                for b in get_collisions(a, bullets[i + 1:])
+            ]
+
+        def sweep():
+            # what the game runs: every row against the player in one call
+            return store.sweep_rect(SIZE / 2, SIZE / 2, (2, 2))
+
+        build()
+        assert (sorted(map(id, get_collisions(player, bullets))) ==
+                sorted(map(id, get_collisions(player, grid))))
+
+        number = max(1, 10000 // count)
+        linear = best(lambda: get_collisions(player, bullets), number)
+        hashed = best(lambda: get_collisions(player, grid), number)
+        built = best(lambda: (build(), get_collisions(player, grid)), number)
+        swept = best(sweep, number)
+        # the quadratic scan is only timed where it finishes in reasonable time
+        pairs_linear = (
+            f'{best(linear_pairs, 1):10.3f}' if count <= 1000 else f'{"-":>10}')
+        pairs_hash = best(lambda: (build(), grid.query_pairs()), 1)
+
+        print(f'{count:>8} {linear:10.3f} {hashed:10.3f} {built:11.3f}'
+              f' {swept:10.3f} {pairs_linear} {pairs_hash:11.3f}')
+
+
+if __name__ == '__main__':
+    main()
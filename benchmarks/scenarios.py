@@ -0,0 +1,69 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src import headless
+from src.level import Level
+
+
+WORLD_MAP = './.cache/maps/world.npy'
+
+SCENARIOS = {
+    'idle': {'entities': 0},
+    '1k': {'entities': 1000},
+    '10k': {'entities': 10000},
+    '50k': {'entities': 50000},
+    # the same population spread over a 6000px world
+    'world-50k': {'entities': 50000, 'level': WORLD_MAP},
+}
+
+
+def world_map(path=WORLD_MAP, tiles=200):
+    path = Path(path)
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Level.arena(tiles).save(path)
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('names', nargs='*', default=list(SCENARIOS))
+    parser.add_argument('--ticks', type=int, default=240)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-draw', action='store_true')
+    parser.add_argument('--output', help='write the report here')
+    args = parser.parse_args(argv)
+
+    world_map()
+    report = {'commit': commit(), 'scenarios': {}}
+    for name in args.names:
+        result = headless.run(
+            ticks=args.ticks, seed=args.seed,
+            draw=not args.no_draw, **SCENARIOS[name])
+        report['scenarios'][name] = result
+        print(f'{name:>9} {result["ms_per_tick"]:8.3f} ms/tick',
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
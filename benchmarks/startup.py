@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.scenarios import commit
+
+
+# run in a fresh interpreter so nothing is already imported or initialised
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from src.main import Game
+imported = time.perf_counter()
+game = Game(headless=HEADLESS)
+created = time.perf_counter()
+game.tick(1 / 60)
+done = time.perf_counter()
+json.dump({
+    'import_ms': (imported - start) * 1000,
+    'init_ms': (created - imported) * 1000,
+    'first_tick_ms': (done - created) * 1000,
+    'first_frame_ms': (done - start) * 1000,
+}, sys.stdout)
+'''
+
+
+def sample(headless):
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy',
+               PYGAME_HIDE_SUPPORT_PROMPT='1')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD.replace('HEADLESS', str(headless))],
+        capture_output=True, text=True, check=True, env=env)
+    return json.loads(result.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--windowed', action='store_true',
+                        help='start the display and mixer as the game does')
+    parser.add_argument('--output', help='write the report here')
+    args = parser.parse_args(argv)
+
+    samples = [sample(not args.windowed) for _ in range(args.runs)]
+    report = {
+        'commit': commit(),
+        'runs': args.runs,
+        'windowed': args.windowed,
+        'median': {
+            key: statistics.median(s[key] for s in samples)
+            for key in samples[0]
+        },
+        'samples': samples,
+    }
+    for key, value in report['median'].items():
+        print(f'{key:>14} {value:8.2f} ms', file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame  # noqa: E402
+
+from . import particles  # noqa: E402
+from .entities import Bullet  # noqa: E402
+from .entities import Shell  # noqa: E402
+from .inputs import InputState  # noqa: E402
+from .inputs import KeySet  # noqa: E402
+from .instrument import PhaseTimer  # noqa: E402
+from .main import Game  # noqa: E402
+
+
+# tunable name -> (object, attribute); bullet speed takes one number or
+# a [low, high] range
+PARAMS = {
+    'fire_rate': (None, 'fire_rate'),
+    'portal_width': (None, 'portal_width'),
+    'bullet_speed': (Bullet, 'speed'),
+    'bullet_life': (Bullet, 'life'),
+    'shell_damping': (Shell, 'damping'),
+}
+DEFAULTS = {
+    name: getattr(owner, attr)
+    for name, (owner, attr) in PARAMS.items() if owner is not None
+}
+
+MOVES = (
+    (), (pygame.K_w,), (pygame.K_s,), (pygame.K_a,), (pygame.K_d,),
+    (pygame.K_w, pygame.K_a), (pygame.K_w, pygame.K_d),
+    (pygame.K_s, pygame.K_a), (pygame.K_s, pygame.K_d),
+)
+
+
+# a cheap stand-in player: wanders, sweeps its aim around the arena,
+# fires in bursts and keeps re-placing both portals
+class BotInput:
+    __slots__ = ['rng', 'size', 'tick', 'mouse', 'keys', 'fire']
+
+    def __init__(self, seed, size=(720, 720)):
+        self.rng = random.Random(seed)
+        self.size = size
+        self.tick = 0
+        self.mouse = (size[0] / 2, size[1] / 2)
+        self.keys = KeySet()
+        self.fire = False
+
+    def aim(self):
+        return (self.rng.uniform(0, self.size[0]),
+                self.rng.uniform(0, self.size[1]))
+
+    def poll(self):
+        rng = self.rng
+        events = []
+        if self.tick % 30 == 0:
+            self.keys = KeySet(rng.choice(MOVES))
+            self.mouse = self.aim()
+        if self.tick % 90 == 0:
+            self.fire = rng.random() < .7
+        # place the orange portal, then the blue one a few ticks later
+        if self.tick % 300 in (0, 3):
+            self.mouse = self.aim()
+            key = pygame.K_q if self.tick % 300 == 0 else pygame.K_e
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+        self.tick += 1
+        return InputState(
+            self.mouse, (self.fire, False, False), self.keys, events)
+
+
+def grid(params):
+    # {'fire_rate': [a, b], ...} -> every combination as its own dict
+    names = list(params)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(params[n] for n in names))
+    ]
+
+
+def configure(game, params):
+    # workers are reused, so class-level tunables go back to their
+    # defaults before each run
+    for name, value in DEFAULTS.items():
+        setattr(PARAMS[name][0], PARAMS[name][1], value)
+    for name, value in params.items():
+        owner, attr = PARAMS[name]
+        if name == 'bullet_speed' and not isinstance(value, (list, tuple)):
+            value = (value, value)
+        setattr(game if owner is None else owner, attr,
+                tuple(value) if isinstance(value, list) else value)
+
+
+def simulate(job):
+    params, seed, ticks, dt = job
+    random.seed(seed)
+    particles.seed(seed)
+    game = Game(headless=True, input_source=BotInput(seed))
+    game.render = False
+    game.timer = PhaseTimer(size=max(1, ticks))
+    configure(game, params)
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        game.tick(dt)
+        if not game.running:
+            break
+    game.sound_payer.close()
+    wall = time.perf_counter() - start
+    ticks = tick + 1
+
+    return {
+        'params': params,
+        'seed': seed,
+        'ticks': ticks,
+        'hits': game.counters['hits'],
+        'traversals': game.counters['traversals'],
+        'health': game.player.health,
+        'peak_projectiles': game.projectiles.peak,
+        'ms_per_tick': wall * 1000 / ticks,
+        'update': game.timer.percentiles().get('update'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run headless simulations over a parameter grid')
+    parser.add_argument(
+        '--param', action='append', nargs='+', default=[],
+        metavar='NAME VALUE',
+        help=f'JSON values to sweep for one of: {", ".join(PARAMS)}')
+    parser.add_argument('--grid', help='JSON file of {name: [values]}')
+    parser.add_argument('--seeds', type=int, default=4,
+                        help='runs per combination, seeded 0..n-1')
+    parser.add_argument('--ticks', type=int, default=1800)
+    parser.add_argument('--dt', type=float, default=1/60)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default='results.jsonl')
+    args = parser.parse_args(argv)
+
+    params = {}
+    if args.grid:
+        with open(args.grid) as f:
+            params.update(json.load(f))
+    for name, *values in args.param:
+        params[name] = [json.loads(v) for v in values]
+    unknown = params.keys() - PARAMS.keys()
+    if unknown:
+        parser.error(f'unknown parameters: {", ".join(sorted(unknown))}')
+
+    jobs = [
+        (combo, seed, args.ticks, args.dt)
+        for combo in grid(params) for seed in range(args.seeds)
+    ]
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool, \
+            open(args.output, 'w') as out:
+        for i, result in enumerate(
+                pool.imap_unordered(simulate, jobs), 1):
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            print(f'{i}/{len(jobs)} {result["params"]} seed={result["seed"]}'
+                  f' hits={result["hits"]}', file=sys.stderr)
+    print(f'{len(jobs)} runs in {time.perf_counter() - start:.1f}s'
+          f' on {args.workers} workers', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
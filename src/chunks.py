@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# ordered so that sorting rows by tier leaves the near ones at the end,
+# where new rows are appended
+ASLEEP, FAR, NEAR = range(3)
+
+
+# the world cut into square chunks. Chunks touching the view, grown by
+# margin chunks, are near; those within far_radius chunks of that are far
+# and everything beyond sleeps
+class ChunkGrid:
+    __slots__ = ['size', 'margin', 'far_radius']
+
+    def __init__(self, size=256, margin=1, far_radius=4):
+        self.size = size
+        self.margin = margin
+        self.far_radius = far_radius
+
+    def span(self, view):
+        # inclusive chunk range covered by the view and its margin
+        size, margin = self.size, self.margin
+        lo = (view.left // size - margin, view.top // size - margin)
+        hi = ((view.right - 1) // size + margin,
+              (view.bottom - 1) // size + margin)
+        return np.array(lo), np.array(hi)
+
+    def tiers(self, view, pos):
+        lo, hi = self.span(view)
+        chunk = np.floor_divide(pos, self.size)
+        # chebyshev distance in chunks from the near range
+        dist = np.maximum(np.maximum(lo - chunk, chunk - hi), 0).max(axis=1)
+        return np.where(
+            dist == 0, NEAR, np.where(dist <= self.far_radius, FAR, ASLEEP)
+        ).astype(np.uint8)
+
+    def tier(self, view, pos):
+        return int(self.tiers(view, np.array([pos], np.float32))[0])
+
+
+# rows sorted by the chunk they sit in, for pulling out everything in a
+# block of chunks without testing every row
+class ChunkIndex:
+    __slots__ = ['size', 'order', 'keys']
+
+    # chunks per key row; worlds are far narrower than this
+    stride = 1 << 20
+
+    def __init__(self, pos, size=256):
+        self.size = size
+        chunk = np.floor_divide(pos, size).astype(np.int64)
+        keys = chunk[:, 1] * self.stride + np.clip(chunk[:, 0], 0, None)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def query(self, lo, hi):
+        # rows in chunks lo..hi inclusive, one search per row of chunks
+        x0, x1 = max(lo[0], 0), hi[0]
+        if x1 < x0 or hi[1] < lo[1]:
+            return self.order[:0]
+        starts = np.arange(lo[1], hi[1] + 1) * self.stride
+        first = np.searchsorted(self.keys, starts + x0)
+        last = np.searchsorted(self.keys, starts + x1 + 1)
+        return np.concatenate([
+            self.order[a:b] for a, b in zip(first.tolist(), last.tolist())
+        ])
+
+    def around(self, pos, reach):
+        # rows in the chunks touched by a box reach on each side of pos
+        size = self.size
+        return self.query(
+            (int((pos[0] - reach) // size), int((pos[1] - reach) // size)),
+            (int((pos[0] + reach) // size), int((pos[1] + reach) // size)))
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import deque
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+from pygame import Vector2  # noqa: E402
+
+from . import netcode  # noqa: E402
+from .batch import BotInput  # noqa: E402
+
+
+class Client:
+    __slots__ = [
+        'reader', 'writer', 'id', 'tick_rate', 'world_size', 'states',
+        'buffer', 'ack', 'seq', 'offset', 'delay',
+        'received', 'snapshots', 'resyncs'
+    ]
+
+    # decoded snapshots kept as baselines for the server's deltas
+    keep = 64
+    # past this many pixels between snapshots an entity is snapped, not
+    # eased, so portal exits don't streak across the map
+    snap_distance = 64
+
+    def __init__(self, reader, writer, client, tick_rate, world_size,
+                 delay_ticks=2):
+        self.reader = reader
+        self.writer = writer
+        self.id = client
+        self.tick_rate = tick_rate
+        self.world_size = world_size
+        self.states = {}
+        # (server time, state) of the latest snapshots, oldest first
+        self.buffer = deque(maxlen=8)
+        self.ack = netcode.NO_BASE
+        self.seq = 0
+        # local clock minus server clock, taken from the fastest arrival
+        self.offset = float('inf')
+        # draw this far behind the newest snapshot so there is usually a
+        # later one to ease towards
+        self.delay = delay_ticks / tick_rate
+        self.received = 0
+        self.snapshots = 0
+        self.resyncs = 0
+
+    @classmethod
+    async def connect(cls, host, port, **kwargs):
+        reader, writer = await asyncio.open_connection(host, port)
+        _, client, tick_rate, w, h = netcode.HELLO_MSG.unpack(
+            await netcode.read_frame(reader))
+        return cls(reader, writer, client, tick_rate, (w, h), **kwargs)
+
+    async def receive(self):
+        # until the connection closes
+        try:
+            while True:
+                payload = await netcode.read_frame(self.reader)
+                self.received += netcode.FRAME.size + len(payload)
+                self.on_snapshot(payload, time.perf_counter())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def on_snapshot(self, payload, now):
+        try:
+            tick, _, state = netcode.decode_snapshot(payload, self.states)
+        except KeyError:
+            # the baseline is gone here; ask for a full snapshot
+            self.ack = netcode.NO_BASE
+            self.resyncs += 1
+            return
+        self.snapshots += 1
+        self.states[tick] = state
+        for old in [t for t in self.states if t <= tick - self.keep]:
+            del self.states[old]
+        self.ack = tick
+
+        server_time = tick / self.tick_rate
+        self.offset = min(self.offset, now - server_time)
+        self.buffer.append((server_time, state))
+
+    def send(self, aim, buttons, held, presses=()):
+        self.seq += 1
+        self.writer.write(netcode.frame(netcode.encode_input(
+            self.seq, self.ack, aim, buttons, held, presses)))
+
+    def sample(self, now=None):
+        # (kind, id, pos, heading, b) of everything, eased between the
+        # two snapshots around the render time
+        if not self.buffer:
+            return None
+        now = time.perf_counter() if now is None else now
+        t = now - self.offset - self.delay
+        entries = list(self.buffer)
+        later = next(
+            (i for i, entry in enumerate(entries) if entry[0] > t), None)
+        if not later:
+            # before the oldest or past the newest: hold the nearest
+            state = entries[-1 if later is None else 0][1]
+            return self.blend(state, state, 1)
+        (t0, a), (t1, b) = entries[later - 1], entries[later]
+        return self.blend(a, b, (t - t0) / (t1 - t0))
+
+    def blend(self, a, b, f):
+        _, ia, ib = np.intersect1d(
+            netcode.keys(a), netcode.keys(b),
+            assume_unique=True, return_indices=True)
+        pos = np.stack((b['x'], b['y']), 1) / np.float32(netcode.SCALE)
+        angle = netcode.heading(b['a'])
+        start = np.stack((a['x'][ia], a['y'][ia]), 1) / np.float32(
+            netcode.SCALE)
+        move = pos[ib] - start
+        ease = np.hypot(move[:, 0], move[:, 1]) < self.snap_distance
+        ia, ib, start, move = ia[ease], ib[ease], start[ease], move[ease]
+        pos[ib] = start + move * f
+        turn = (angle[ib] - netcode.heading(a['a'][ia]) + 180) % 360 - 180
+        angle[ib] -= turn * (1 - f)
+        return b['kind'], b['id'], pos, angle, b['b']
+
+    def close(self):
+        self.writer.close()
+
+
+async def bot(host, port, seed, seconds):
+    client = await Client.connect(host, port)
+    brain = BotInput(seed)
+    receiving = asyncio.create_task(client.receive())
+    loop = asyncio.get_running_loop()
+    period = 1 / client.tick_rate
+    start = loop.time()
+    sampled = 0
+    sample_time = 0
+    while loop.time() - start < seconds and not receiving.done():
+        state = brain.poll()
+        # the bot aims as if the window were centred on its player
+        aim = (Vector2(state.mouse) - Vector2(brain.size) / 2) / 3
+        presses = [event.key for event in state.events
+                   if event.type == pygame.KEYDOWN]
+        client.send(aim, state.buttons, state.keys, presses)
+        begin = time.perf_counter()
+        if client.sample() is not None:
+            sampled += 1
+            sample_time += time.perf_counter() - begin
+        await asyncio.sleep(period)
+    elapsed = loop.time() - start
+    client.close()
+    receiving.cancel()
+    return {
+        'id': client.id,
+        'bytes_per_s': client.received / elapsed,
+        'snapshots': client.snapshots,
+        'resyncs': client.resyncs,
+        'sample_ms': sample_time * 1000 / max(1, sampled),
+    }
+
+
+async def run_bots(host, port, count, seconds):
+    results = await asyncio.gather(*(
+        bot(host, port, seed, seconds) for seed in range(count)))
+    rates = np.array([r['bytes_per_s'] for r in results])
+    return {
+        'count': count,
+        'bytes_per_s': {'mean': float(rates.mean()),
+                        'max': float(rates.max())},
+        'snapshots': sum(r['snapshots'] for r in results),
+        'resyncs': sum(r['resyncs'] for r in results),
+        'sample_ms': float(np.mean([r['sample_ms'] for r in results])),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Connect headless bot clients to a server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--bots', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        run_bots(args.host, args.port, args.bots, args.seconds))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
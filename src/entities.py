@@ -1,19 +1,25 @@
 import math
 import random
 
+import numpy as np
 import pygame
 from pygame import Vector2
 
+from . import particles
+from .particles import ParticleBuffer
+from .sprites import SpriteCache
+
 
 class Player:
     __slots__ = [
-        'pos', 'vel', 'speed',
+        'pos', 'prev_pos', 'vel', 'speed',
         'max_health', 'health',
         'emitter'
     ]
 
     def __init__(self, pos, vel):
         self.pos = Vector2(pos)
+        self.prev_pos = Vector2(pos)
         self.vel = Vector2(vel)
         self.speed = 50
         self.max_health = 100
@@ -34,114 +40,126 @@ class Player:
         self.emitter.pos = self.pos
         self.emitter.update(dt)
 
+    def move(self, dt, bounds, level=None):
+        prev = Vector2(self.pos)
+        self.update(dt)
+        pos = self.pos
+
+        if pos.x < 0:
+            pos.x = 0
+        elif pos.x > bounds[0]:
+            pos.x = bounds[0]
+
+        if pos.y < 0:
+            pos.y = 0
+        elif pos.y > bounds[1]:
+            pos.y = bounds[1]
+
+        # resolve one axis at a time so the player slides along walls
+        if level and not level.solid_at(prev.x, prev.y):
+            if level.solid_at(pos.x, prev.y):
+                pos.x = prev.x
+            if level.solid_at(pos.x, pos.y):
+                pos.y = prev.y
+
     @property
     def rect(self):
         return pygame.Rect(self.pos-Vector2(2), (4, 4))
 
-    def draw(self, surface, mpos):
-        vec = (mpos - self.pos).normalize()
+    def draw(self, surface, mpos, alpha=1, dirty=None, offset=(0, 0)):
+        pos = self.prev_pos.lerp(self.pos, alpha) - offset
         # draw the particles
-        self.emitter.draw(surface)
+        self.emitter.draw(surface, dirty, offset)
+        self.draw_body(surface, pos, mpos - Vector2(offset), dirty)
+
+    @staticmethod
+    def draw_body(surface, pos, mpos, dirty=None):
+        vec = mpos - pos
+        vec = vec.normalize() if vec else Vector2(1, 0)
 
         # draw the "gun"
-        pygame.draw.line(surface, (0, 200, 200), self.pos +
-                         vec * 4, self.pos + vec * 10, 1)
+        gun = pygame.draw.line(surface, (0, 200, 200), pos +
+                               vec * 4, pos + vec * 10, 1)
         # draw the player
-        pygame.draw.circle(surface, (0, 200, 0), self.pos, 2)
-
+        body = pygame.draw.circle(surface, (0, 200, 0), pos, 2)
 
-class Bullet:
-    __slots__ = [
-        'pos', 'vel', 'speed', '_speed',
-        '_surf', 'life'
-    ]
+        if dirty:
+            dirty.mark_rect(gun.union(body))
 
-    def __init__(self, pos, vel):
-        self.pos = Vector2(pos)
-        self.vel = Vector2(vel)
-        self.speed = 100
-        self._speed = 100
-        self.life = 5
-        surf = pygame.Surface(Vector2(4, 2))
-        pygame.draw.rect(surf, (100, 100, 100), (0, 0, 4, 2))
-        self._surf = surf
 
-    @property
-    def rect(self):
-        return pygame.Rect(self.pos-Vector2(1), (2, 2))
+def _bullet_base(variant):
+    surf = pygame.Surface(Vector2(4, 2))
+    pygame.draw.rect(surf, (100, 100, 100), (0, 0, 4, 2))
+    return surf
 
-    @property
-    def surf(self):
-        if not self.vel:
-            return self._surf
-        vel = self.vel.normalize()
-        degrees = math.degrees(math.atan2(vel.y, vel.x))
-        angle = (360 + degrees) % 360
-        return pygame.transform.rotozoom(self._surf, -angle, self.life / 5)
 
-    def update(self, dt):
-        self.pos += self.vel * self.speed * dt
-        self.life -= dt
+def _shell_base(variant):
+    surf = pygame.Surface(Vector2(4, 2))
+    pygame.draw.rect(surf, (200, 200, 0), (0, 0, 1, 2))
+    pygame.draw.rect(surf, (200, 0, 0), (1, 0, 3, 2))
+    return surf
 
-    def draw(self, surface):
-        surface.blit(self.surf, self.pos - Vector2(self.surf.get_size())/2)
 
+def _portal_base(variant):
+    color, width, alpha = variant
+    surf = pygame.Surface(Vector2(width, 1))
+    surf.fill(color)
+    surf.set_alpha(alpha)
+    return surf
 
-class Shell:
-    __slots__ = [
-        'pos', 'vel', 'speed', '_speed',
-        '_surf', 'life', 'rot_speed'
-    ]
 
-    def __init__(self, pos, vel):
-        self.pos = Vector2(pos)
-        self.vel = Vector2(vel)
-        self.speed = random.randint(20, 40)
-        self._speed = int(self.speed)
-        self.life = 5
-        self.rot_speed = random.random()
-        surf = pygame.Surface(Vector2(4, 2))
-        pygame.draw.rect(surf, (200, 200, 0), (0, 0, 1, 2))
-        pygame.draw.rect(surf, (200, 0, 0), (1, 0, 3, 2))
-        self._surf = surf
+def _portal_transform(surf, angle, scale):
+    rotated = pygame.transform.rotate(surf, -angle)
+    rotated.set_alpha(surf.get_alpha())
+    return rotated
 
-    @property
-    def rect(self):
-        return pygame.Rect(self.pos-Vector2(1), (2, 2))
 
-    @property
-    def surf(self):
-        if not self.vel:
-            return self._surf
-        vel = self.vel.normalize()
-        degrees = math.degrees(math.atan2(vel.y, vel.x))
-        angle = (360 + degrees - 90 -
-                 (360 * ((self.speed/self._speed)*self.rot_speed))) % 360
-        return pygame.transform.rotozoom(self._surf, -angle, self.life / 5)
+class Bullet:
+    speed = (100, 100)
+    rot_speed = (0, 0)
+    life = 5
+    damping = 0
+    collides = True
+    portals = True
+    sprite_offset = 0
+    sprites = SpriteCache('bullet', _bullet_base)
 
-    def update(self, dt):
-        self.pos += self.vel * self.speed * dt
-        self.life -= dt
-        self.speed *= 1 - dt * 1.8
 
-    def draw(self, surface):
-        surface.blit(self.surf, self.pos - Vector2(self.surf.get_size())/2)
+class Shell:
+    speed = (20, 40)
+    rot_speed = (0, 1)
+    life = 5
+    damping = 1.8
+    collides = False
+    portals = True
+    sprite_offset = -90
+    sprites = SpriteCache('shell', _shell_base)
 
 
 class Portal:
     __slots__ = [
-        'pos', 'normal', 'width', '_surf',
+        'pos', 'normal', 'perp', 'width',
+        'line', 'exit',
         'color', 'particle_emitter', 'active',
         'deactivate_when_empty'
     ]
 
-    def __init__(self, pos, vec, color):
+    sprites = SpriteCache('portal', _portal_base, _portal_transform,
+                          angle_step=1)
+
+    def __init__(self, pos, vec, color, width=12):
         self.pos = Vector2(pos)
         self.normal = Vector2(-vec).normalize()
-        self.width = 12
-        self._surf = pygame.Surface(Vector2(self.width, 1))
+        self.width = width
         self.color = list(color)
-        self._surf.fill(self.color)
+
+        # portals never move, so their geometry is fixed once placed
+        self.perp = Vector2(-self.normal.y, self.normal.x).normalize()
+        self.exit = self.pos + self.normal * 2
+        self.line = (
+            self.pos - self.perp * self.width / 2,
+            self.pos + self.perp * self.width / 2
+        )
 
         self.active = False
         self.deactivate_when_empty = False
@@ -154,20 +172,6 @@ class Portal:
             particle_kwargs={'color': self.color}
         )
 
-    @property
-    def perp(self):
-        return Vector2(-self.normal.y, self.normal.x).normalize()
-
-    @property
-    def exit(self):
-        return self.pos + self.normal * 2
-
-    @property
-    def line(self):
-        start = self.pos - self.perp * self.width / 2
-        end = self.pos + self.perp * self.width / 2
-        return (start, end)
-
     def burst(self):
         self.particle_emitter.burst()
 
@@ -175,35 +179,54 @@ class Portal:
         if self.active:
             self.particle_emitter.update(dt)
 
+    def sprite_key(self):
+        perp = self.perp
+        alpha = 100 if not self.active else 200
+        return (math.degrees(math.atan2(perp.y, perp.x)),
+                (tuple(self.color), self.width, alpha))
+
     @property
     def surf(self):
-        degrees = math.degrees(math.atan2(self.perp.y, self.perp.x))
-        angle = (360 + degrees) % 360
-        surf = pygame.transform.rotate(self._surf, -angle)
-        surf.set_alpha(100 if not self.active else 200)
-        return surf
+        angle, variant = self.sprite_key()
+        return self.sprites.get(angle, variant=variant)
 
-    def draw(self, surface):
-        self.particle_emitter.draw(surface)
-        surface.blit(self.surf, self.pos - Vector2(self.surf.get_size())/2)
+    def draw(self, surface, dirty=None, offset=(0, 0)):
+        self.particle_emitter.draw(surface, dirty, offset)
+        surf = self.surf
+        rect = surface.blit(
+            surf, self.pos - offset - Vector2(surf.get_size())/2)
+        if dirty:
+            dirty.mark_rect(rect)
 
 
 class Camera:
-    __slots__ = ['pos', 'offset', 'target']
+    __slots__ = ['pos', 'offset', 'target', 'lookahead']
 
-    def __init__(self, pos, target=None, offset=None):
+    def __init__(self, pos, target=None, offset=None, lookahead=.25):
         self.pos = Vector2(pos)
         self.target = target
         self.offset = Vector2(offset) if offset else Vector2()
+        # seconds of the target's velocity to lead it by
+        self.lookahead = lookahead
 
     def update(self):
         if not self.target:
             return
-        if hasattr(self.target, 'vel') and hasattr(self.target, 'speed'):
-            self.pos = self.pos.lerp(
-                self.target.pos + (self.target.vel * self.target.speed), .1) + self.offset
-        else:
-            self.pos = self.pos.lerp(self.target.pos, .1) + self.offset
+        goal = self.target.pos + self.offset
+        if hasattr(self.target, 'vel'):
+            goal += self.target.vel * self.lookahead
+        self.pos = self.pos.lerp(goal, .1)
+
+    def view(self, size, bounds):
+        # the size x size rect centred on the camera, kept inside bounds;
+        # a view larger than bounds is centred on them instead
+        size = (int(size[0]), int(size[1]))
+        topleft = []
+        for centre, length, bound in zip(self.pos, size, bounds):
+            room = int(bound) - length
+            start = int(centre) - length // 2
+            topleft.append(room // 2 if room < 0 else min(max(start, 0), room))
+        return pygame.Rect(topleft, size)
 
 
 class ParticleEmitter:
@@ -237,7 +260,7 @@ class ParticleEmitter:
     def __init__(self, pos, vel=None, speed=None,
                  spawn_rate=None, shape=None,
                  particle_class=None, particle_kwargs=None,
-                 debug=False):
+                 capacity=64, debug=False):
         self.pos = Vector2(pos)
         self.vel = Vector2(vel).normalize() if vel else None
         self.speed = speed
@@ -250,22 +273,19 @@ class ParticleEmitter:
         self.active = True
         self.deactivate_after_burst = False
         self.debug = debug
-        self.particles = []
+        self.particles = ParticleBuffer(capacity)
         self.age = 0
 
     def update(self, dt):
         self.last_spawn += dt
 
-        spawn_rate = (1/self.spawn_rate) if self.spawn_rate > 0 else 0
+        rate = self.spawn_rate * particles.density
+        spawn_rate = (1/rate) if rate > 0 else 0
         if spawn_rate and self.last_spawn >= spawn_rate:
-            for _ in range(max(1, int(dt/spawn_rate))):
-                self.create_particle()
+            self.emit(max(1, int(dt/spawn_rate)))
             self.last_spawn = 0
 
-        for particle in self.particles[:]:
-            particle.update(dt)
-            if not particle.alive:
-                self.particles.remove(particle)
+        self.particles.update(dt)
 
         if self.deactivate_after_burst and not self.particles:
             self.active = False
@@ -273,115 +293,123 @@ class ParticleEmitter:
         self.age += dt
 
     def create_particle(self):
-        vel = self.vel
-        if not vel:
-            vel = Vector2(
-                random.random() - .5,
-                random.random() - .5
-            ).normalize()
-        speed = self.speed or random.randint(5, 10)
+        self.emit(1)
 
-        pos = self.pos
+    def emit(self, count):
+        if count <= 0:
+            return
+        rng = particles.rng
 
-        if isinstance(self.shape, self.Point):
-            # alter the velocity angle +/- point spread
-            vel = vel.rotate(
-                random.uniform(-self.shape.spread, self.shape.spread))
-
-        if isinstance(self.shape, self.Line):
-            length = self.shape.vec.length()
-            particle_pos = self.shape.vec.normalize() * (random.random() * length)
-            half = self.shape.vec / 2
-            pos = pos - half + particle_pos
-
-        elif isinstance(self.shape, self.Circle):
-            pos = pos + Vector2(
-                random.random() - .5,
-                random.random() - .5
-            ).normalize() * random.random() * self.shape.radius
-
-        elif isinstance(self.shape, self.Rectangle):
-            center = self.shape.size/2
-            point = Vector2(
-                random.random() * self.shape.size.x,
-                random.random() * self.shape.size.y
-            )
-            pos = pos - center + point
+        if self.vel:
+            vel = np.empty((count, 2), np.float32)
+            vel[:] = (self.vel.x, self.vel.y)
+        else:
+            theta = rng.uniform(0, math.tau, count)
+            vel = np.stack((np.cos(theta), np.sin(theta)), axis=1)
 
-        self.particles.append(
-            self.particle_class(pos, vel * speed, **self.particle_kwargs)
+        if self.speed:
+            vel *= self.speed
+        else:
+            vel *= rng.integers(5, 11, count)[:, None]
+
+        pos = np.empty((count, 2), np.float32)
+        pos[:] = (self.pos.x, self.pos.y)
+
+        shape = self.shape
+        if isinstance(shape, self.Point):
+            # alter the velocity angle +/- point spread
+            if shape.spread:
+                theta = np.radians(
+                    rng.uniform(-shape.spread, shape.spread, count))
+                cos, sin = np.cos(theta), np.sin(theta)
+                vel = np.stack((
+                    vel[:, 0] * cos - vel[:, 1] * sin,
+                    vel[:, 0] * sin + vel[:, 1] * cos
+                ), axis=1)
+
+        if isinstance(shape, self.Line):
+            t = rng.random(count)[:, None] - .5
+            pos += t * (shape.vec.x, shape.vec.y)
+
+        elif isinstance(shape, self.Circle):
+            theta = rng.uniform(0, math.tau, count)
+            r = rng.random(count) * shape.radius
+            pos[:, 0] += np.cos(theta) * r
+            pos[:, 1] += np.sin(theta) * r
+
+        elif isinstance(shape, self.Rectangle):
+            pos += (rng.random((count, 2)) - .5) * (shape.size.x, shape.size.y)
+
+        particle_class = self.particle_class
+        low, high = particle_class.speed
+        color = self.particle_kwargs.get('color', particle_class.color)
+        if len(color) == 3:
+            color = (*color, 255)
+
+        self.particles.spawn(
+            pos, vel,
+            self.particle_kwargs.get('lifetime', particle_class.lifetime),
+            rng.integers(low, high + 1, count),
+            color
         )
 
     def burst(self, count=None, deactivate_after=False):
         if isinstance(count, list):
-            count = range(*count) if len(count) == 2 else count[0]
-        else:
-            count = range(random.randint(5, 10)
-                          ) if count is None else range(count)
-        for _ in count:
-            self.create_particle()
+            count = random.randint(*count) if len(count) == 2 else count[0]
+        elif count is None:
+            count = random.randint(5, 10)
+        count = round(count * particles.density)
+        self.emit(count)
+        if count:
             self.deactivate_after_burst = deactivate_after
 
-    def draw(self, surface):
+    def draw(self, surface, dirty=None, offset=(0, 0)):
+        pos = self.pos - offset
 
         if self.debug:
             c = (0, 200, 200)
             if isinstance(self.shape, self.Point):
-                surface.set_at([*map(int, self.pos)], c)
+                surface.set_at([*map(int, pos)], c)
             elif isinstance(self.shape, self.Line):
                 half = self.shape.vec/2
-                start = self.pos - half
-                end = self.pos + half
+                start = pos - half
+                end = pos + half
                 pygame.draw.line(surface, c, start, end)
             elif isinstance(self.shape, self.Circle):
-                pygame.draw.circle(surface, c, self.pos, self.shape.radius, 1)
+                pygame.draw.circle(surface, c, pos, self.shape.radius, 1)
             elif isinstance(self.shape, self.Rectangle):
                 center = self.shape.size/2
                 pygame.draw.rect(
-                    surface, c, (self.pos - center, self.shape.size), 1)
+                    surface, c, (pos - center, self.shape.size), 1)
+
+        n = len(self.particles)
+        if n:
+            particles.draw(
+                surface,
+                self.particles.pos[:n] - offset,
+                self.particles.color[:n],
+                self.particles.alpha(self.particle_class.fade),
+                dirty
+            )
 
-        for particle in self.particles:
-            particle.draw(surface)
+    def render_list(self, offset=(0, 0)):
+        # copies, safe to draw while the live buffer keeps changing
+        n = len(self.particles)
+        return (
+            self.particles.pos[:n] - offset,
+            self.particles.color[:n].copy(),
+            np.array(self.particles.alpha(self.particle_class.fade))
+        )
 
 
 class Particle:
-    __slots__ = [
-        'pos', 'vel', 'age',
-        'lifetime', 'color', 'speed'
-    ]
-
-    def __init__(self, pos, vel):
-        self.pos = Vector2(pos)
-        self.vel = Vector2(vel)
-        self.age = 0
-        self.lifetime = 3
-        self.color = [0, 200, 0, 255]
-        self.speed = random.randint(5, 10)
-
-    @property
-    def alive(self):
-        return self.age < self.lifetime
-
-    def update(self, dt):
-        self.pos += self.vel * self.speed * dt
-        self.age += dt
-
-    def draw(self, surface):
-        surface.set_at([*map(int, self.pos)], self.color)
+    lifetime = 3
+    speed = (5, 10)
+    color = (0, 200, 0, 255)
+    fade = False
 
 
 class FadeOutParticle(Particle):
-    def __init__(self, pos, vel, color):
-        super().__init__(pos, vel)
-        self.color = color
-        self.lifetime = .5
-        self.speed = random.randint(1, 3)
-        self.surf = pygame.Surface((1, 1))
-        self.surf.fill(self.color)
-
-    def update(self, dt):
-        super().update(dt)
-        self.surf.set_alpha(max(0, (1 - (self.age / self.lifetime)) * 255))
-
-    def draw(self, surface):
-        surface.blit(self.surf, self.pos)
+    lifetime = .5
+    speed = (1, 3)
+    fade = True
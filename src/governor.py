@@ -0,0 +1,114 @@
+import os
+import sys
+
+import numpy as np
+
+
+# what the game is allowed to spend at one quality level. particles
+# scales emitter spawn rates and burst sizes, shells caps live shells
+# (None for no cap), angle_step is the projectile sprite rotation step in
+# degrees, voices caps mixer channels (None for all) and render_scale
+# divides the resolution the view is drawn at before it is scaled up to
+# the window, so fewer pixels are drawn per frame
+class Quality:
+    __slots__ = ['particles', 'shells', 'angle_step', 'voices', 'render_scale']
+
+    def __init__(self, particles=1, shells=None, angle_step=2, voices=None,
+                 render_scale=1):
+        self.particles = particles
+        self.shells = shells
+        self.angle_step = angle_step
+        self.voices = voices
+        self.render_scale = render_scale
+
+    def changes(self, other):
+        # name -> (ours, theirs) for every setting that differs
+        return {
+            name: (getattr(self, name), getattr(other, name))
+            for name in self.__slots__
+            if getattr(self, name) != getattr(other, name)
+        }
+
+
+# best first; each step sheds the cheapest-to-lose work before the next
+LEVELS = (
+    Quality(),
+    Quality(particles=.5),
+    Quality(particles=.5, shells=256, angle_step=4),
+    Quality(particles=.25, shells=128, angle_step=6, voices=4),
+    Quality(particles=.25, shells=64, angle_step=10, voices=2,
+            render_scale=1.25),
+)
+
+
+# steps quality down when recent frames run over budget and back up once
+# they sit well under it. The gap between degrade_at and restore_at, and
+# the hold before any restore, keep it from flapping between two levels
+class Governor:
+    __slots__ = [
+        'budget', 'levels', 'level', 'times', 'frames', 'since',
+        'degrade_at', 'restore_at', 'hold', 'history'
+    ]
+
+    def __init__(self, budget=1000/60, levels=LEVELS, window=30,
+                 degrade_at=1, restore_at=.6, hold=180):
+        self.budget = budget
+        self.levels = levels
+        self.level = 0
+        # frame times in ms, a ring of the last window frames
+        self.times = np.zeros(window)
+        self.frames = 0
+        # frames since the last change; judged only on a full window
+        self.since = 0
+        self.degrade_at = degrade_at
+        self.restore_at = restore_at
+        self.hold = hold
+        self.history = []
+
+    @property
+    def quality(self):
+        return self.levels[self.level]
+
+    def update(self, frame_ms):
+        # -> the new Quality when the level changes, else None
+        self.times[self.frames % len(self.times)] = frame_ms
+        self.frames += 1
+        self.since += 1
+        if self.since < len(self.times):
+            return None
+
+        # a high percentile so a steady stutter counts but one spike doesn't
+        recent = float(np.percentile(self.times, 90))
+        if (recent > self.budget * self.degrade_at and
+                self.level < len(self.levels) - 1):
+            return self.change(self.level + 1, recent)
+        if (recent < self.budget * self.restore_at and self.level > 0 and
+                self.since >= self.hold):
+            return self.change(self.level - 1, recent)
+        return None
+
+    def change(self, level, recent):
+        old, new = self.quality, self.levels[level]
+        entry = {
+            'frame': self.frames,
+            'from': self.level,
+            'to': level,
+            'p90_ms': recent,
+            'budget_ms': self.budget,
+            'changes': old.changes(new),
+        }
+        self.history.append(entry)
+        settings = ', '.join(
+            f'{name} {a} -> {b}' for name, (a, b) in entry['changes'].items())
+        print(f'quality {self.level} -> {level} at frame {self.frames}'
+              f' (p90 {recent:.1f}ms, budget {self.budget:.1f}ms): {settings}',
+              file=sys.stderr)
+        self.level = level
+        self.since = 0
+        return new
+
+
+def from_env(environ=os.environ):
+    if environ.get('PORTAL_GOVERNOR', '1') == '0':
+        return None
+    return Governor(float(environ.get('PORTAL_BUDGET_MS', 1000/60)))
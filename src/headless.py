@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+from pygame import Vector2  # noqa: E402
+
+from . import particles  # noqa: E402
+from .entities import Bullet  # noqa: E402
+from .entities import Shell  # noqa: E402
+from .inputs import ScriptedInput  # noqa: E402
+from .instrument import PhaseTimer  # noqa: E402
+from .main import Game  # noqa: E402
+from .pipeline import Pipeline  # noqa: E402
+
+
+# place both portals, then strafe while firing through them
+DEFAULT_SCRIPT = [
+    {'tick': 0, 'mouse': (200, 200)},
+    {'tick': 1, 'press': ['q']},
+    {'tick': 2, 'mouse': (560, 520)},
+    {'tick': 3, 'press': ['e']},
+    {'tick': 4, 'mouse': (240, 220), 'fire': True},
+    {'tick': 60, 'keys': ['w', 'd']},
+    {'tick': 120, 'keys': ['s'], 'mouse': (600, 300)},
+    {'tick': 180, 'keys': [], 'fire': False},
+    {'tick': 200, 'fire': True, 'mouse': (100, 600)},
+]
+
+
+def populate(game, count):
+    size = game.world_size
+    spawned = 0
+    while spawned < count:
+        pos = (random.random() * size.x, random.random() * size.y)
+        if game.level and game.level.solid_at(*pos):
+            continue
+        game.projectiles.spawn(
+            Shell if spawned % 2 else Bullet, pos,
+            Vector2(1, 0).rotate(random.random() * 360)
+        )
+        spawned += 1
+
+
+def run(ticks=600, seed=0, entities=0, script=None, dt=1/60, draw=True,
+        pipelined=False, level='./maps/level1.txt'):
+    random.seed(seed)
+    particles.seed(seed)
+
+    game = Game(
+        headless=True,
+        input_source=ScriptedInput(
+            DEFAULT_SCRIPT if script is None else script),
+        level=level
+    )
+    game.render = draw
+    game.timer = PhaseTimer(size=max(1, ticks))
+    populate(game, entities)
+
+    pipeline = Pipeline(game) if pipelined else None
+    start = time.perf_counter()
+    for tick in range(ticks):
+        (pipeline or game).tick(dt)
+        if not game.running:
+            break
+    if pipeline:
+        pipeline.close()
+    game.sound_payer.close()
+    wall = time.perf_counter() - start
+    ticks = tick + 1
+
+    return {
+        'ticks': ticks,
+        'seed': seed,
+        'entities': entities,
+        'dt': dt,
+        'draw': draw,
+        'pipelined': pipelined,
+        'level': level,
+        'wall_ms': wall * 1000,
+        'ms_per_tick': wall * 1000 / ticks,
+        'first_frame_ms': game.first_frame * 1000,
+        'phases': game.timer.report(ticks),
+        'final': {
+            'projectiles': len(game.projectiles),
+            'peak_projectiles': game.projectiles.peak,
+            'pool': game.projectiles.stats(),
+            'health': game.player.health,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the game without a window and report timings')
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--entities', type=int, default=0)
+    parser.add_argument('--dt', type=float, default=1/60)
+    parser.add_argument('--script', help='JSON file of scripted input')
+    parser.add_argument('--level', default='./maps/level1.txt')
+    parser.add_argument('--no-draw', action='store_true')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='simulate on a worker thread while drawing')
+    parser.add_argument('--output', help='write the report here')
+    args = parser.parse_args(argv)
+
+    script = None
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+
+    report = run(args.ticks, args.seed, args.entities, script,
+                 args.dt, not args.no_draw, args.pipelined, args.level)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+import pygame
+
+
+class KeySet(frozenset):
+    def __getitem__(self, key):
+        return key in self
+
+
+class InputState:
+    __slots__ = ['mouse', 'buttons', 'keys', 'events']
+
+    def __init__(self, mouse=(0, 0), buttons=(False, False, False),
+                 keys=KeySet(), events=()):
+        self.mouse = tuple(mouse)
+        self.buttons = tuple(buttons)
+        self.keys = keys
+        self.events = list(events)
+
+
+class LiveInput:
+    def poll(self):
+        return InputState(
+            pygame.mouse.get_pos(),
+            pygame.mouse.get_pressed(),
+            pygame.key.get_pressed(),
+            pygame.event.get()
+        )
+
+
+def key_code(name):
+    return name if isinstance(name, int) else getattr(pygame, f'K_{name}')
+
+
+# script entries are dicts keyed by 'tick' that may set 'mouse' (window
+# coordinates), 'keys' (names of held keys) and 'fire' (left button held),
+# or send 'press' (KEYDOWN per key name) and 'wheel' events; held state
+# persists until a later entry changes it
+class ScriptedInput:
+    __slots__ = ['script', 'tick', 'mouse', 'keys', 'fire']
+
+    def __init__(self, script, mouse=(0, 0)):
+        self.script = {}
+        for entry in script:
+            self.script.setdefault(entry['tick'], []).append(entry)
+        self.tick = 0
+        self.mouse = tuple(mouse)
+        self.keys = KeySet()
+        self.fire = False
+
+    def poll(self):
+        events = []
+        for entry in self.script.get(self.tick, ()):
+            if 'mouse' in entry:
+                self.mouse = tuple(entry['mouse'])
+            if 'keys' in entry:
+                self.keys = KeySet(map(key_code, entry['keys']))
+            if 'fire' in entry:
+                self.fire = bool(entry['fire'])
+            for key in entry.get('press', ()):
+                events.append(pygame.event.Event(
+                    pygame.KEYDOWN, key=key_code(key)))
+            if entry.get('wheel'):
+                events.append(pygame.event.Event(
+                    pygame.MOUSEWHEEL, x=0, y=entry['wheel']))
+        self.tick += 1
+        return InputState(
+            self.mouse, (self.fire, False, False), self.keys, events)
@@ -0,0 +1,229 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextlib import nullcontext
+
+import numpy as np
+
+
+class PhaseTimer:
+    __slots__ = [
+        'totals', 'counts', 'history', 'current',
+        'size', 'frames', 'path', 'flush_every'
+    ]
+
+    def __init__(self, size=600, path=None, flush_every=600):
+        self.size = size
+        self.path = path
+        self.flush_every = flush_every
+        self.reset()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, elapsed):
+        self.totals[name] += elapsed
+        self.counts[name] += 1
+        self.current[name] += elapsed
+
+    def end_frame(self):
+        slot = self.frames % self.size
+        for name in self.current.keys() - self.history.keys():
+            self.history[name] = np.zeros(self.size)
+        for name, history in self.history.items():
+            history[slot] = self.current.get(name, 0)
+        self.current.clear()
+        self.frames += 1
+        if self.path and self.frames % self.flush_every == 0:
+            self.flush()
+
+    def reset(self):
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.history = {}
+        self.current = defaultdict(float)
+        self.frames = 0
+
+    def last(self, name):
+        history = self.history.get(name)
+        if history is None or not self.frames:
+            return 0
+        return history[(self.frames - 1) % self.size] * 1000
+
+    def recent(self, name):
+        history = self.history.get(name)
+        if history is None:
+            return np.zeros(0)
+        if self.frames < self.size:
+            return history[:self.frames]
+        # oldest first
+        slot = self.frames % self.size
+        return np.concatenate((history[slot:], history[:slot]))
+
+    def percentiles(self):
+        stats = {}
+        for name in self.history:
+            recent = self.recent(name) * 1000
+            p50, p95, p99 = np.percentile(recent, (50, 95, 99))
+            stats[name] = {
+                'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                'last_ms': recent[-1],
+            }
+        return stats
+
+    def report(self, frames=None):
+        frames = max(1, self.frames if frames is None else frames)
+        percentiles = self.percentiles()
+        return {
+            name: {
+                'total_ms': total * 1000,
+                'per_frame_ms': total * 1000 / frames,
+                'calls': self.counts[name],
+                **percentiles.get(name, {}),
+            }
+            for name, total in self.totals.items()
+        }
+
+    def flush(self):
+        if not self.path:
+            return
+        with open(self.path, 'w') as f:
+            json.dump({'frames': self.frames, 'phases': self.report()},
+                      f, indent=2)
+
+
+class NullTimer:
+    __slots__ = []
+
+    frames = 0
+    _context = nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+    def add(self, name, elapsed):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def last(self, name):
+        return 0
+
+    def percentiles(self):
+        return {}
+
+    def report(self, frames=None):
+        return {}
+
+    def flush(self):
+        pass
+
+
+class ProfileCapture:
+    __slots__ = [
+        'path', 'flush_every', 'profile', 'worker',
+        'remaining', 'since_flush'
+    ]
+
+    def __init__(self, path='profile.prof', flush_every=120):
+        self.path = path
+        self.flush_every = flush_every
+        self.profile = None
+        # cProfile only sees the thread that enabled it, so a pipelined
+        # simulation thread gets a profile of its own
+        self.worker = None
+        self.remaining = 0
+        self.since_flush = 0
+
+    @property
+    def active(self):
+        return self.profile is not None
+
+    def start(self, frames=300):
+        if self.active:
+            return
+        import cProfile
+        self.profile = cProfile.Profile()
+        self.remaining = frames
+        self.since_flush = 0
+        self.profile.enable()
+
+    @contextmanager
+    def on_worker(self):
+        # profiles the block on the calling thread while a capture runs;
+        # flush() and stop() must not run while a block is open
+        if not self.active:
+            yield
+            return
+        if self.worker is None:
+            import cProfile
+            self.worker = cProfile.Profile()
+        self.worker.enable()
+        try:
+            yield
+        finally:
+            self.worker.disable()
+
+    def toggle(self, frames=300):
+        if self.active:
+            self.stop()
+        else:
+            self.start(frames)
+
+    def end_frame(self):
+        if not self.active:
+            return
+        self.remaining -= 1
+        self.since_flush += 1
+        if self.remaining <= 0:
+            self.stop()
+        elif self.since_flush >= self.flush_every:
+            self.flush()
+
+    def dump(self):
+        import pstats
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        if self.worker is not None:
+            stats.add(self.worker)
+        stats.dump_stats(self.path)
+
+    def flush(self):
+        # dump what we have so far so a crash does not lose the capture
+        self.dump()
+        self.profile.enable()
+        self.since_flush = 0
+
+    def stop(self):
+        if not self.active:
+            return
+        self.dump()
+        print(f'profile written to {self.path}')
+        self.profile = None
+        self.worker = None
+
+
+def from_env(environ=os.environ):
+    path = environ.get('PORTAL_TIMERS_PATH')
+    if environ.get('PORTAL_TIMERS') or path:
+        timer = PhaseTimer(
+            int(environ.get('PORTAL_TIMERS_FRAMES', 600)), path)
+    else:
+        timer = NullTimer()
+
+    capture = ProfileCapture(environ.get('PORTAL_PROFILE_PATH', 'profile.prof'))
+    frames = environ.get('PORTAL_PROFILE')
+    if frames:
+        capture.start(int(frames))
+    return timer, capture
@@ -0,0 +1,142 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pygame
+
+
+class Level:
+    __slots__ = ['tiles', 'tile_size', 'color', '_image', '_walls']
+
+    # pre-render the walls at full resolution up to this many pixels
+    max_cached_pixels = 2048 * 2048
+
+    def __init__(self, tiles, tile_size=16, color=(90, 80, 100)):
+        self.tiles = tiles
+        self.tile_size = tile_size
+        self.color = color
+        self._image = None
+        self._walls = None
+
+    @staticmethod
+    def parse(text):
+        rows = [row.split() for row in text.splitlines() if row.strip()]
+        if any(len(row) != len(rows[0]) for row in rows):
+            raise ValueError('map rows must all have the same length')
+        return np.array(rows, np.uint8)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        path = Path(path)
+        if path.suffix == '.npy':
+            # binary maps are memory-mapped, tiles are paged in on demand
+            tiles = np.load(path, mmap_mode='r')
+        else:
+            tiles = cls.parse(path.read_text())
+        return cls(tiles, **kwargs)
+
+    @classmethod
+    def arena(cls, tiles, density=.03, seed=0, **kwargs):
+        # open floor with scattered pillars, walled in, clear in the middle
+        rng = np.random.default_rng(seed)
+        grid = (rng.random((tiles, tiles)) < density).astype(np.uint8)
+        grid[[0, -1], :] = 1
+        grid[:, [0, -1]] = 1
+        middle = tiles // 2
+        grid[middle - 4:middle + 4, middle - 4:middle + 4] = 0
+        return cls(grid, **kwargs)
+
+    def save(self, path):
+        np.save(path, np.ascontiguousarray(self.tiles, np.uint8))
+
+    @property
+    def width(self):
+        return self.tiles.shape[1]
+
+    @property
+    def height(self):
+        return self.tiles.shape[0]
+
+    @property
+    def size(self):
+        return (self.width * self.tile_size, self.height * self.tile_size)
+
+    def solid_at(self, x, y):
+        tx = np.floor_divide(x, self.tile_size).astype(np.intp)
+        ty = np.floor_divide(y, self.tile_size).astype(np.intp)
+        inside = (0 <= tx) & (tx < self.width) & (0 <= ty) & (ty < self.height)
+        # everything outside the map is solid
+        return ~inside | (self.tiles[
+            np.where(inside, ty, 0), np.where(inside, tx, 0)] != 0)
+
+    def first_solid(self, start, end):
+        # sample each segment at most a quarter tile apart so that nothing
+        # skips over a wall; returns the first blocked sample's t and the
+        # sample spacing
+        move = end - start
+        length = np.hypot(move[:, 0], move[:, 1])
+        samples = max(1, int(np.ceil(
+            length.max(initial=0) / (self.tile_size / 4))))
+        toi = np.full(len(start), np.inf)
+        for k in range(1, samples + 1):
+            t = k / samples
+            point = start + move * t
+            blocked = np.isinf(toi) & self.solid_at(point[:, 0], point[:, 1])
+            toi[blocked] = t
+        return toi, 1 / samples
+
+    @property
+    def image(self):
+        # one pixel per tile
+        if self._image is None:
+            solid = np.asarray(self.tiles).T != 0
+            image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+            rgb = pygame.surfarray.pixels3d(image)
+            rgb[solid] = self.color
+            del rgb
+            alpha = pygame.surfarray.pixels_alpha(image)
+            alpha[:] = solid * 255
+            del alpha
+            self._image = image
+        return self._image
+
+    @property
+    def walls(self):
+        w, h = self.size
+        if self._walls is None and w * h <= self.max_cached_pixels:
+            self._walls = pygame.transform.scale(self.image, (w, h))
+        return self._walls
+
+    def draw(self, surface, view=None, offset=(0, 0), zoom=1):
+        # zoom draws each tile at tile_size * zoom pixels; offset is in
+        # surface pixels
+        view = pygame.Rect(view or ((0, 0), surface.get_size()))
+        if self.walls is not None and zoom == 1:
+            surface.blit(self.walls, offset, view)
+            return
+
+        # too big to cache at full size, or scaled: scale just the
+        # visible tiles
+        ts = self.tile_size
+        area = view.clip((0, 0), self.size)
+        if not area.w or not area.h:
+            return
+        tx0, ty0 = area.left // ts, area.top // ts
+        tx1, ty1 = -(-area.right // ts), -(-area.bottom // ts)
+        tiles = self.image.subsurface((tx0, ty0, tx1 - tx0, ty1 - ty0))
+        scaled = pygame.transform.scale(
+            tiles, (round((tx1 - tx0) * ts * zoom),
+                    round((ty1 - ty0) * ts * zoom)))
+        surface.blit(scaled, (
+            offset[0] + (tx0 * ts - view.left) * zoom,
+            offset[1] + (ty0 * ts - view.top) * zoom
+        ))
+
+
+def main(argv=None):
+    src, dest = (argv or sys.argv[1:])[:2]
+    Level.load(src).save(dest)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,73 +1,206 @@
+import math
+import os
 import random
+import time
 
+import numpy as np
 import pygame
 from pygame import Vector2
 
 from .sound import SoundPlayer
 
+from . import chunks
+from .chunks import ChunkGrid
 from .entities import Bullet
+from .entities import Camera
 from .entities import Player
 from .entities import Portal
 from .entities import Shell
-from .util import intersect
-from .util import point_dist_to_line
-from .util import get_collisions
-from .util import remap
-
-import cProfile
-import pstats
-
-pygame.init()
+from . import governor
+from .inputs import InputState
+from .inputs import LiveInput
+from .inputs import ScriptedInput
+from .level import Level
+from .overlay import PerfOverlay
+from .pipeline import Pipeline
+from .pipeline import Scene
+from . import instrument
+from . import particles
+from .portals import PortalNetwork
+from .registry import Registry
+from .render import DirtyTiles
+from . import snapshot
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, input_source=None,
+                 level='./maps/level1.txt'):
+        self.created = time.perf_counter()
+        self.first_frame = None
+        self.headless = headless
         self.window_size = Vector2(720)
-        self.window = pygame.display.set_mode(
-            self.window_size, pygame.DOUBLEBUF)
-        pygame.display.set_caption('playground')
-
-        self.screen_scale = 3
-        self.screen = pygame.Surface(self.window_size/self.screen_scale)
-        self.screen_size = Vector2(self.screen.get_size())
+        # only the subsystems in use are started; the mixer is left to
+        # SoundPlayer and fonts to the overlay
+        if headless:
+            self.window = pygame.Surface(self.window_size)
+        else:
+            pygame.display.init()
+            self.window = pygame.display.set_mode(
+                self.window_size, pygame.DOUBLEBUF)
+            pygame.display.set_caption('playground')
+
+        self.background = (60, 50, 60)
+        self.dirty_rendering = True
+        self.dirty = DirtyTiles(self.window_size)
+        self.last_shake = (0, 0)
+        self.level = Level.load(level, tile_size=30) if level else None
+        # follows the player once there is one
+        self.camera = Camera((0, 0))
+        # the view is drawn at 1 / render_scale of its size, see set_quality
+        self.render_scale = 1
+        self.scaled_scene = Scene()
+        self.resize_screen(3)
         self.running = True
 
-        self.sound_payer = SoundPlayer('./assets/sounds', 'wav')
+        self.sound_payer = SoundPlayer(
+            './assets/sounds', 'wav', enabled=not headless,
+            priority={'Hurt1': 3, 'Shoot1': 2, 'Portal1': 2, 'Ricochet1': 1},
+            voices={'Ricochet1': 3, 'Step1': 1},
+            warm=('Shoot1', 'Step1', 'Ricochet1'),
+            cache_dir='./.cache/sounds')
 
         self.clock = pygame.time.Clock()
-        self.mpos = Vector2(pygame.mouse.get_pos()) / self.screen_scale
-
-        self.player = Player(self.screen_size / 2, Vector2())
+        self.input_source = input_source or (
+            ScriptedInput(()) if headless else LiveInput())
+        self.controls = InputState()
+        self.mpos = Vector2(self.controls.mouse) / self.screen_scale
+        self.timer, self.profile_capture = instrument.from_env()
+        self.overlay = PerfOverlay()
+        # sheds detail when frames run over budget. Lower quality spawns
+        # fewer shells and particles, which changes the simulation, so
+        # headless runs and replays go without it
+        self.governor = None if headless else governor.from_env()
+
+        self.player = Player(self.world_size / 2, Vector2())
         self.player_walk_timer = 0
+        self.camera.pos = Vector2(self.player.pos)
+        self.camera.target = self.player
+        self.update_view()
 
-        self.entities = []
+        # sized for sustained fire so the columns never regrow mid-fight
+        self.projectiles = Registry((Bullet, Shell), capacity=2048)
 
         self.portals = [None, None]
+        self.portal_network = PortalNetwork()
+        self.portal_width = 12
+
+        # only what is near the view is drawn and simulated every step;
+        # far chunks catch up every far_every steps and the rest sleep
+        self.chunks = ChunkGrid(size=256, margin=1, far_radius=4)
+        self.far_every = 8
+        self.far_dt = 0
+        self.steps = 0
 
         self.time_scale = 1
         self.shot_timer = 0
         self.fire_rate = 1/40
+        # live shells, None for no cap; the governor lowers it under load
+        self.max_shells = None
+        # quality settings live partly in module and class state, so every
+        # game starts from full quality whatever the last one left behind
+        self.set_quality(governor.LEVELS[0])
+
+        # running totals for balancing runs
+        self.counters = {'hits': 0, 'traversals': 0}
 
         self.screen_shake = Vector2()
 
+        # simulation runs in fixed steps of game time, None for one
+        # variable step per frame
+        self.fixed_step = 1/120
+        self.max_steps = 8
+        self.accumulator = 0
+        self.alpha = 1
+
+        self.max_fps = 0
+        self.render = True
+        # simulate on a worker thread while the last tick is drawn
+        self.pipelined = os.environ.get('PORTAL_PIPELINE') == '1'
+        # set to a replay.Recorder to log every tick's input
+        self.recorder = None
+        # the Pipeline driving this game, which handles UI events itself
+        self.pipeline = None
+
     def run(self):
-        with cProfile.Profile() as p:
+        pipeline = Pipeline(self) if self.pipelined else None
+        tick = pipeline.tick if pipeline else self.tick
+        try:
             while self.running:
-                self.process_events()
-                self.update()
+                tick()
+        finally:
+            if pipeline:
+                pipeline.close()
+            self.profile_capture.stop()
+            self.timer.flush()
+            if self.recorder:
+                self.recorder.close()
+            self.sound_payer.close()
+
+    def tick(self, tdt=None):
+        if tdt is None:
+            tdt = self.clock.tick(self.max_fps) * 0.001
+        polled = time.perf_counter()
+        self.simulate(tdt)
+        if self.render:
+            with self.timer.phase('draw'):
                 self.draw()
-
-        stats = pstats.Stats(p)
-        stats.sort_stats(pstats.SortKey.TIME)
-        stats.dump_stats('profile.prof')
+            # input to photon: how old the input behind this frame is
+            self.timer.add('latency', time.perf_counter() - polled)
+        self.end_frame()
+
+    def simulate(self, tdt):
+        with self.timer.phase('events'):
+            self.process_events()
+            if self.recorder:
+                self.recorder.write(self.controls, tdt)
+        with self.timer.phase('update'):
+            self.update(tdt)
+            self.sound_payer.flush(pygame.time.get_ticks() / 1000)
+
+    def end_frame(self):
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter() - self.created
+        self.timer.end_frame()
+        self.profile_capture.end_frame()
+        if self.governor:
+            # work time only, not time spent waiting on the frame cap
+            quality = self.governor.update(self.clock.get_rawtime())
+            if quality:
+                self.set_quality(quality)
+
+    def set_quality(self, quality):
+        particles.set_density(quality.particles)
+        self.max_shells = quality.shells
+        for kind in self.projectiles.kinds:
+            if kind.sprites.angle_step != quality.angle_step:
+                kind.sprites.configure(angle_step=quality.angle_step)
+        self.sound_payer.voice_limit = quality.voices
+        if quality.render_scale != self.render_scale:
+            # only the surfaces change; the view and the mouse do not
+            self.render_scale = quality.render_scale
+            self.resize_screen(self.screen_scale)
+        self.quality = quality
 
     def process_events(self):
-        mpos = Vector2(pygame.mouse.get_pos()) / self.screen_scale
+        self.controls = self.input_source.poll()
+        if not self.pipeline:
+            self.process_ui_events(self.controls.events)
+        mpos = self.world_mouse()
 
         self.process_pygame_events()
 
         self.player.vel = Vector2()
-        pressed = pygame.key.get_pressed()
+        pressed = self.controls.keys
         if pressed[pygame.K_w]:
             self.player.vel.y -= self.player.speed
         if pressed[pygame.K_s]:
@@ -85,14 +218,17 @@ class Game:
             self.sound_payer.play('Step1', volume=.2)
             self.player_walk_timer = 0
 
-        if pygame.mouse.get_pressed()[0] and not self.shot_timer:
+        if (self.controls.buttons[0] and not self.shot_timer and
+                mpos != self.player.pos):
             fire_vec = (mpos - self.player.pos).normalize()
-            self.entities.append(
-                Bullet(self.player.pos + fire_vec * 15, fire_vec))
+            self.projectiles.spawn(
+                Bullet, self.player.pos + fire_vec * 15, fire_vec)
 
             eject_vec = Vector2(-fire_vec.y, fire_vec.x)
-            self.entities.append(
-                Shell(self.player.pos + (fire_vec * 4) + (eject_vec * 4), eject_vec))
+            if (self.max_shells is None or
+                    len(self.projectiles.store(Shell)) < self.max_shells):
+                self.projectiles.spawn(
+                    Shell, self.player.pos + (fire_vec * 4) + (eject_vec * 4), eject_vec)
 
             shake = fire_vec * -(random.random() * 4 + 4)
             self.player.vel = shake * 10
@@ -104,139 +240,342 @@ class Game:
             self.time_scale = 0.2
 
     def process_pygame_events(self):
-        mpos = Vector2(pygame.mouse.get_pos()) / self.screen_scale
-        for event in pygame.event.get():
+        mpos = self.world_mouse()
+        for event in self.controls.events:
             if (event.type == pygame.QUIT or
                 (event.type == pygame.KEYDOWN and
                  event.key == pygame.K_ESCAPE)):
                 self.running = False
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_q:
-                    self.portals[0] = Portal(
-                        mpos, (mpos - self.player.pos), (255, 127, 0))
+                    self.set_portal(0, Portal(
+                        mpos, (mpos - self.player.pos), (255, 127, 0),
+                        self.portal_width))
                 elif event.key == pygame.K_e:
-                    self.portals[1] = Portal(
-                        mpos, (mpos - self.player.pos), (41, 174, 255))
+                    self.set_portal(1, Portal(
+                        mpos, (mpos - self.player.pos), (41, 174, 255),
+                        self.portal_width))
                 elif event.key == pygame.K_z:
-                    self.portals[0] = None
+                    self.set_portal(0, None)
                 elif event.key == pygame.K_x:
-                    self.portals[1] = None
+                    self.set_portal(1, None)
 
                 elif event.key == pygame.K_SPACE:
                     print(f'{self.player.health=} {self.clock.get_fps()=}')
-
-            elif event.type == pygame.MOUSEWHEEL:
-                self.screen_scale = min(
-                    6, max(self.screen_scale + event.y * .05, 1))
-                self.screen = pygame.Surface(
-                    self.window_size/self.screen_scale)
-                self.screen_size = Vector2(self.screen.get_size())
-
-    def update(self):
-        tdt = self.clock.tick() * 0.001
+                    print(f'  first frame {self.first_frame * 1000:.1f}ms')
+                    print(f'  projectiles {self.projectiles.stats()}')
+                    print(f'  particles   {self.player.emitter.particles.stats()}')
+                    if self.governor:
+                        print(f'  quality     level {self.governor.level}'
+                              f' after {len(self.governor.history)} changes')
+                    for name, stats in self.timer.percentiles().items():
+                        print(f'  {name:<10} p50={stats["p50_ms"]:.2f}ms'
+                              f' p95={stats["p95_ms"]:.2f}ms'
+                              f' p99={stats["p99_ms"]:.2f}ms')
+
+    def process_ui_events(self, events):
+        # zooming replaces the surfaces being drawn and the UI keys swap
+        # render state or start and stop the profiler. A pipeline runs
+        # this on the main thread while its worker is idle; either way it
+        # runs before the tick reads the mouse, so a recording replays
+        # the same whichever mode made it
+        for event in events:
+            if event.type == pygame.MOUSEWHEEL:
+                self.resize_screen(min(
+                    6, max(self.screen_scale + event.y * .05, 1)))
+            elif event.type != pygame.KEYDOWN:
+                continue
+            elif event.key == pygame.K_F3:
+                self.overlay.toggle()
+                self.dirty.invalidate()
+                # the overlay reads its update/draw split from the timer
+                if isinstance(self.timer, instrument.NullTimer):
+                    self.timer = instrument.PhaseTimer()
+            elif event.key == pygame.K_F9:
+                self.profile_capture.toggle()
+
+    def snapshot(self):
+        return snapshot.pack(self)
+
+    def restore(self, state):
+        snapshot.unpack(self, state)
+
+    @property
+    def world_size(self):
+        return Vector2(self.level.size) if self.level else self.view_size
+
+    def world_mouse(self):
+        return (Vector2(self.controls.mouse) / self.screen_scale +
+                self.view.topleft)
+
+    def update_view(self):
+        self.view = self.camera.view(self.view_size, self.world_size)
+
+    def resize_screen(self, scale):
+        # scale sets how much of the world is seen; render_scale only how
+        # many pixels it is drawn with before scaling up to the window
+        self.screen_scale = scale
+        self.view_size = Vector2(
+            [int(size) for size in self.window_size / self.screen_scale])
+        self.screen = pygame.Surface(self.view_size/self.render_scale)
+        self.screen_size = Vector2(self.screen.get_size())
+        self.zoom = self.screen_size.x / self.view_size.x
+        self.layer = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+        self.dirty.resize(self.screen.get_size())
+
+        # static background and level walls, composited again only when
+        # the view moves
+        self.backdrop = pygame.Surface(self.screen.get_size())
+        self.backdrop_view = None
+        self.update_view()
+
+    def draw_backdrop(self, view):
+        self.backdrop.fill(self.background)
+        if self.level:
+            # a view larger than the level has it centred, off the edges
+            area = view.clip(pygame.Rect((0, 0), self.level.size))
+            self.level.draw(
+                self.backdrop, area,
+                ((area.left - view.left) * self.zoom,
+                 (area.top - view.top) * self.zoom), self.zoom)
+        self.backdrop_view = pygame.Rect(view)
+        self.dirty.invalidate()
+
+    def update(self, tdt=None):
+        if tdt is None:
+            tdt = self.clock.tick(self.max_fps) * 0.001
 
         if self.player.health > 0:
             self.time_scale = min(1, self.time_scale + tdt * 2)
 
         self.screen_shake = self.screen_shake * 0.9
 
+        self.mpos = self.world_mouse()
+
         dt = tdt * self.time_scale
-        self.shot_timer = max(0, self.shot_timer - dt)
+        if not self.fixed_step:
+            self.step(dt)
+            self.alpha = 1
+            return
 
-        self.mpos = Vector2(pygame.mouse.get_pos()) / self.screen_scale
+        self.accumulator += dt
+        steps = 0
+        while self.accumulator >= self.fixed_step:
+            if steps == self.max_steps:
+                # drop the backlog rather than spiral further behind
+                self.accumulator %= self.fixed_step
+                break
+            self.step(self.fixed_step)
+            self.accumulator -= self.fixed_step
+            steps += 1
+        self.alpha = self.accumulator / self.fixed_step
+
+    def step(self, dt):
+        self.shot_timer = max(0, self.shot_timer - dt)
 
         self.player_walk_timer += dt
 
-        self.player.update(dt)
-
-        if self.player.pos.x < 0:
-            self.player.pos.x = 0
-        elif self.player.pos.x > self.screen_size.x:
-            self.player.pos.x = self.screen_size.x
+        self.player.prev_pos = Vector2(self.player.pos)
+        self.move_player(dt)
+
+        with self.timer.phase('portals'):
+            self.do_portal(self.player)
+        self.move_player(dt)
+        self.camera.update()
+        self.update_view()
+
+        repartition = self.steps % self.far_every == 0
+        self.far_dt += dt
+        far_step = self.steps % self.far_every == self.far_every - 1
+        self.steps += 1
+
+        self.sound_payer.listener = self.player.pos
+
+        # each system visits only the stores whose kind it applies to
+        registry = self.projectiles
+        dead = {}
+        for store in registry:
+            if repartition:
+                # amortised: one O(n) re-sort every far_every steps
+                registry.partition(store, self.chunks.tiers(
+                    self.view, store.pos[:store.count]))
+            dead[store] = [self.move_projectiles(store, dt, far_step)]
+
+        with self.timer.phase('collisions'):
+            for store in registry.query('collides'):
+                # nothing outside the near tier can reach the player
+                hits = store.sweep_rect(
+                    self.player.prev_pos, self.player.pos, (2, 2),
+                    store.tier_rows(chunks.NEAR))
+                dead[store].append(hits)
+                self.counters['hits'] += len(hits)
+                for i in hits.tolist():
+                    self.player.health -= 10
+                    if self.player.health > 0:
+                        x, y = store.vel[i].tolist()
+                        self.player.emitter.vel = Vector2(-y, x)
+                        self.player.emitter.burst()
+                        self.sound_payer.play('Hurt1')
+                    else:
+                        self.player.emitter.vel = None
+                        self.player.emitter.burst(50)
+                        self.time_scale = 0.05
+
+        for store, rows in dead.items():
+            registry.remove(store, np.concatenate(rows))
 
-        if self.player.pos.y < 0:
-            self.player.pos.y = 0
-        elif self.player.pos.y > self.screen_size.y:
-            self.player.pos.y = self.screen_size.y
-
-        self.do_portal(self.player)
-        self.player.update(dt)
-
-        for entity in self.entities[:]:
-            entity.update(dt)
-
-            if entity.life < 0:
-                self.entities.remove(entity)
-                continue
-
-            if not (0 < entity.pos.x < self.screen_size.x):
-                entity.pos.x = 0 if entity.pos.x < 0 else self.screen_size.x
-                entity.vel.x *= -1
-                volume = remap(
-                    self.player.pos.distance_to(entity.pos),
-                    200, 0, 0, 1
-                )
-                if volume:
-                    self.sound_payer.play('Ricochet1', volume=volume)
-            if not (0 < entity.pos.y < self.screen_size.y):
-                entity.pos.y = 0 if entity.pos.y < 0 else self.screen_size.y
-                entity.vel.y *= -1
-                volume = remap(
-                    self.player.pos.distance_to(entity.pos),
-                    200, 0, 0, 1
-                )
-                if volume:
-                    self.sound_payer.play('Ricochet1', volume=volume)
-
-            self.do_portal(entity)
-
-        for collision in get_collisions(self.player, [e for e in self.entities if isinstance(e, Bullet)]):
-            self.player.health -= 10
-            self.entities.remove(collision)
-            if self.player.health > 0:
-                vel = Vector2(-entity.vel.y, entity.vel.x)
-                self.player.emitter.vel = vel
-                self.player.emitter.burst()
-                self.sound_payer.play('Hurt1')
-            else:
-                self.player.emitter.vel = None
-                self.player.emitter.burst(50)
-                self.time_scale = 0.05
         for portal in self.portals:
-            if portal:
+            if not portal:
+                continue
+            tier = self.chunks.tier(self.view, portal.pos)
+            if tier == chunks.NEAR:
                 portal.update(dt)
-                portal.active = all(self.portals)
+            elif tier == chunks.FAR and far_step:
+                portal.update(self.far_dt)
+        if far_step:
+            self.far_dt = 0
+
+    def move_projectiles(self, store, dt, far_step):
+        boxes = self.portal_network.boxes if store.kind.portals else ()
+        results = [store.update(
+            dt, self.world_size, boxes, self.level,
+            store.tier_rows(chunks.NEAR))]
+        if far_step:
+            results.append(store.update(
+                self.far_dt, self.world_size, boxes, self.level,
+                store.tier_rows(chunks.FAR)))
+        ricochets, expired, candidates = (
+            np.concatenate(result) for result in zip(*results))
+
+        self.sound_payer.play_at('Ricochet1', store.pos[ricochets])
+
+        if len(candidates):
+            with self.timer.phase('portals'):
+                pos, vel = store.pos, store.vel
+                rows, src, _ = self.portal_network.crossings(
+                    store.prev_pos[candidates], pos[candidates])
+                if len(rows):
+                    rows = candidates[rows]
+                    dest = self.portal_network.transfer(pos, vel, rows, src)
+                    store.snap(rows)
+                    self.on_portal(src, dest, pos[rows])
+        return expired
+
+    def move_player(self, dt):
+        self.player.move(dt, self.world_size, self.level)
+
+    def set_portal(self, index, portal):
+        if index >= len(self.portals):
+            self.portals.extend([None] * (index + 1 - len(self.portals)))
+        self.portals[index] = portal
+        self.portal_network.rebuild(self.portals)
 
     def do_portal(self, entity):
-        if not (all(self.portals) and entity.vel):
+        if not (len(self.portal_network) and entity.vel):
             return
-        for i, portal in enumerate(self.portals):
-            intersects = intersect(
-                entity.pos, entity.pos + entity.vel.normalize() * 10, *portal.line)
-            dist = point_dist_to_line(entity.pos, portal.line)
-            if intersects and dist <= 3:
-                dest = self.portals[(i+1) % 2]
-                entity.pos = dest.exit
-                entity.vel = (entity.vel + portal.normal +
-                              dest.normal).normalize()
-                portal.burst()
-                dest.burst()
-                volume = remap(
-                    self.player.pos.distance_to(entity.pos),
-                    200, 0, 0, 1
-                )
-                self.sound_payer.play('Portal1', volume=volume)
-
-    def draw(self):
-        self.screen.fill((60, 50, 60))
-        layer = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
-
-        [entity.draw(layer) for entity in self.entities]
-
-        self.player.draw(layer, self.mpos)
-
-        [portal.draw(layer) for portal in self.portals if portal]
-
-        self.screen.blit(layer, self.screen_shake)
-        pygame.transform.scale(self.screen, self.window_size, self.window)
-        pygame.display.flip()
+        pos = np.array([entity.pos], np.float32)
+        vel = np.array([entity.vel], np.float32)
+        rows, src, _ = self.portal_network.crossings(
+            np.array([entity.prev_pos], np.float32), pos)
+        if len(rows):
+            dest = self.portal_network.transfer(pos, vel, rows, src)
+            entity.pos = Vector2(pos[0].tolist())
+            entity.vel = Vector2(vel[0].tolist())
+            entity.prev_pos = Vector2(entity.pos)
+            self.on_portal(src, dest, pos)
+
+    def on_portal(self, src, dest, exits):
+        portals = self.portal_network.portals
+        self.counters['traversals'] += len(src)
+        for i, j in zip(src.tolist(), dest.tolist()):
+            portals[i].burst()
+            portals[j].burst()
+        self.sound_payer.play_at('Portal1', exits)
+
+    def visible_portals(self):
+        return [
+            portal for portal in self.portals if portal and
+            self.chunks.tier(self.view, portal.pos) == chunks.NEAR
+        ]
+
+    def draw(self, scene=None):
+        dirty = self.dirty
+        layer = self.layer
+
+        if scene is None and self.zoom != 1:
+            # only a scene can be drawn scaled to the internal resolution
+            scene = self.scaled_scene
+            scene.capture(self, time.perf_counter())
+
+        view = self.view if scene is None else scene.view
+        if view != self.backdrop_view:
+            self.draw_backdrop(view)
+
+        # everything drawn last frame lies inside last frame's dirty tiles
+        if dirty.full or not self.dirty_rendering:
+            layer.fill((0, 0, 0, 0))
+        else:
+            for rect in dirty.rects():
+                layer.fill((0, 0, 0, 0), rect)
+
+        if scene is None:
+            offset = Vector2(view.topleft)
+            for store in self.projectiles:
+                store.draw(layer, self.alpha, dirty,
+                           store.tier_rows(chunks.NEAR), view)
+
+            self.player.draw(layer, self.mpos, self.alpha, dirty, offset)
+
+            for portal in self.visible_portals():
+                portal.draw(layer, dirty, offset)
+            screen_shake = self.screen_shake
+        else:
+            scene.draw(layer, dirty, self.zoom)
+            screen_shake = scene.shake * self.zoom
+
+        if self.overlay.visible:
+            dirty.mark_rect(self.overlay.bounds)
+
+        shake = (int(screen_shake.x), int(screen_shake.y))
+        full = (
+            dirty.full or not self.dirty_rendering or
+            shake != (0, 0) or self.last_shake != (0, 0) or
+            dirty.coverage() > .6
+        )
+        self.last_shake = shake
+
+        if full:
+            self.screen.fill(self.background)
+            self.screen.blit(self.backdrop, screen_shake)
+            self.screen.blit(layer, screen_shake)
+            self.overlay.draw(self.screen, self)
+            pygame.transform.scale(self.screen, self.window_size, self.window)
+            if not self.headless:
+                pygame.display.flip()
+        else:
+            rects = dirty.rects()
+            for rect in rects:
+                self.screen.blit(self.backdrop, rect, rect)
+                self.screen.blit(layer, rect, rect)
+            self.overlay.draw(self.screen, self)
+
+            sx = self.window_size.x / self.screen_size.x
+            sy = self.window_size.y / self.screen_size.y
+            window_rects = []
+            for rect in rects:
+                x, y = math.floor(rect.x * sx), math.floor(rect.y * sy)
+                target = pygame.Rect(
+                    x, y,
+                    math.ceil(rect.right * sx) - x,
+                    math.ceil(rect.bottom * sy) - y
+                ).clip(self.window.get_rect())
+                if not target.w or not target.h:
+                    continue
+                pygame.transform.scale(
+                    self.screen.subsurface(rect), target.size,
+                    self.window.subsurface(target))
+                window_rects.append(target)
+            if not self.headless:
+                pygame.display.update(window_rects)
+
+        dirty.swap()
@@ -0,0 +1,169 @@
+import struct
+
+import numpy as np
+import pygame
+
+from .replay import KEYS
+
+
+HELLO, SNAPSHOT, INPUT = range(3)
+
+# length prefix of every message
+FRAME = struct.Struct('<I')
+# kind, client id, tick rate, world width and height
+HELLO_MSG = struct.Struct('<BHHII')
+# kind, tick, baseline tick, then how many removed, moved and full records
+SNAPSHOT_MSG = struct.Struct('<BIIIII')
+# kind, sequence, last snapshot tick received, aim offset from the player
+# in quarter pixels, button bits, held key bits, key press bits
+INPUT_MSG = struct.Struct('<BIIhhBBB')
+NO_BASE = 0xffffffff
+
+# key presses since the last input message, besides the held KEYS
+PRESSES = (pygame.K_q, pygame.K_e, pygame.K_z, pygame.K_x)
+
+# wire kinds; projectile kinds follow, in registry order
+PLAYER, PORTAL = range(2)
+# positions are sent in quarter pixels
+SCALE = 4
+
+# a: heading in 256ths of a turn; b: health, life fraction or active flag
+ENTITY = np.dtype([
+    ('kind', 'u1'), ('id', '<u4'), ('x', '<u2'), ('y', '<u2'),
+    ('a', 'u1'), ('b', 'u1'),
+])
+# an entity that moved a little since the baseline, by its row there
+MOVED = np.dtype([
+    ('ref', '<u2'), ('dx', 'i1'), ('dy', 'i1'), ('a', 'u1'), ('b', 'u1'),
+])
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(size)
+
+
+def keys(state):
+    return state['kind'].astype(np.uint64) << 32 | state['id']
+
+
+def by_key(state):
+    return state[np.argsort(keys(state), kind='stable')]
+
+
+def quantize_pos(pos):
+    return np.clip(np.rint(np.asarray(pos) * SCALE), 0, 65535).astype('<u2')
+
+
+def quantize_angle(degrees):
+    return (np.rint(np.asarray(degrees) * 256 / 360).astype(np.int64)
+            % 256).astype(np.uint8)
+
+
+def heading(a):
+    return np.asarray(a, np.float32) * 360 / 256
+
+
+def _body(state):
+    # the x, y, a and b bytes of every record as one void item each, which
+    # numpy gathers far faster than the packed records field by field
+    return state.view(np.uint8).reshape(-1, ENTITY.itemsize)[
+        :, ENTITY.fields['x'][1]:].view('V6')[:, 0]
+
+
+def encode_snapshot(tick, base_tick, base, state, base_keys=None,
+                    state_keys=None):
+    # state and base are sorted by key; their keys may be passed in when
+    # the caller has them already. Entities unchanged since base are left
+    # out, small moves are sent relative to it and everything else in
+    # full; without a base the whole state goes out
+    if base is None or len(base) > 0xffff:
+        return SNAPSHOT_MSG.pack(
+            SNAPSHOT, tick, NO_BASE, 0, 0, len(state)) + state.tobytes()
+
+    # both are sorted by key, so matching rows is a binary search
+    if base_keys is None:
+        base_keys = keys(base)
+    if state_keys is None:
+        state_keys = keys(state)
+    ib = np.searchsorted(base_keys, state_keys)
+    ic = np.flatnonzero(
+        base_keys[np.minimum(ib, len(base) - 1)] == state_keys
+    ) if len(base) else np.empty(0, np.intp)
+    ib = ib[ic]
+    # x, y and a with b as three u2 columns
+    old = _body(base)[ib].view('<u2').reshape(-1, 3)
+    new = _body(state)[ic].view('<u2').reshape(-1, 3)
+    dx = new[:, 0].astype(np.int32) - old[:, 0]
+    dy = new[:, 1].astype(np.int32) - old[:, 1]
+    same = (dx == 0) & (dy == 0) & (new[:, 2] == old[:, 2])
+    small = ~same & (np.abs(dx) < 128) & (np.abs(dy) < 128)
+
+    # anything re-sent in full is removed first
+    gone = np.ones(len(base), bool)
+    gone[ib[same | small]] = False
+    removed = np.flatnonzero(gone).astype('<u2')
+
+    moved = np.empty(np.count_nonzero(small), MOVED)
+    moved['ref'] = ib[small]
+    moved['dx'] = dx[small]
+    moved['dy'] = dy[small]
+    ab = new[:, 2][small]
+    moved['a'] = ab & 0xff
+    moved['b'] = ab >> 8
+
+    fresh = np.ones(len(state), bool)
+    fresh[ic[same | small]] = False
+    full = np.take(state, np.flatnonzero(fresh))
+
+    return SNAPSHOT_MSG.pack(
+        SNAPSHOT, tick, base_tick, len(removed), len(moved), len(full)
+    ) + removed.tobytes() + moved.tobytes() + full.tobytes()
+
+
+def decode_snapshot(payload, baselines):
+    # -> (tick, base tick, state); baselines maps tick to decoded state
+    _, tick, base_tick, n_removed, n_moved, n_full = \
+        SNAPSHOT_MSG.unpack_from(payload)
+    offset = SNAPSHOT_MSG.size
+    removed = np.frombuffer(payload, '<u2', n_removed, offset)
+    offset += removed.nbytes
+    moved = np.frombuffer(payload, MOVED, n_moved, offset)
+    offset += moved.nbytes
+    full = np.frombuffer(payload, ENTITY, n_full, offset)
+
+    if base_tick == NO_BASE:
+        return tick, base_tick, by_key(full)
+    state = baselines[base_tick].copy()
+    rows = moved['ref']
+    state['x'][rows] += moved['dx'].astype(np.int32).astype('<u2')
+    state['y'][rows] += moved['dy'].astype(np.int32).astype('<u2')
+    state['a'][rows] = moved['a']
+    state['b'][rows] = moved['b']
+    kept = np.ones(len(state), bool)
+    kept[removed] = False
+    return tick, base_tick, by_key(np.concatenate((state[kept], full)))
+
+
+def encode_input(seq, ack, aim, buttons, held, presses):
+    x, y = np.clip(np.rint(np.asarray(aim) * SCALE), -32768, 32767)
+    return INPUT_MSG.pack(
+        INPUT, seq, ack, int(x), int(y),
+        sum(bool(b) << i for i, b in enumerate(buttons[:3])),
+        sum(bool(held[k]) << i for i, k in enumerate(KEYS)),
+        sum(1 << i for i, k in enumerate(PRESSES) if k in presses))
+
+
+def decode_input(payload):
+    # -> (sequence, ack, aim, buttons, held keys, pressed keys)
+    _, seq, ack, x, y, buttons, held, presses = INPUT_MSG.unpack(payload)
+    return (
+        seq, ack, (x / SCALE, y / SCALE),
+        [bool(buttons >> i & 1) for i in range(3)],
+        [k for i, k in enumerate(KEYS) if held >> i & 1],
+        [k for i, k in enumerate(PRESSES) if presses >> i & 1],
+    )
@@ -0,0 +1,104 @@
+import sys
+
+import pygame
+
+from . import sprites
+
+
+class PerfOverlay:
+    __slots__ = [
+        'visible', 'font', 'text', 'values', 'graph',
+        'budget', 'refresh_every', 'frames', 'blocks', 'sampled', 'pos',
+        'bounds'
+    ]
+
+    def __init__(self, pos=(2, 2), width=80, height=20,
+                 budget=1000/30, refresh_every=15):
+        self.visible = False
+        self.pos = pos
+        self.bounds = pygame.Rect(pos, (0, 0))
+        self.font = None
+        # label -> (value, rendered surface); only re-rendered on change
+        self.text = {}
+        self.values = {}
+        self.graph = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.budget = budget
+        self.refresh_every = refresh_every
+        self.frames = 0
+        # allocated blocks and the frame count at the last sample
+        self.blocks = sys.getallocatedblocks()
+        self.sampled = 0
+
+    def toggle(self):
+        self.visible = not self.visible
+        if self.visible:
+            # frames only count while visible, so restart the baseline
+            self.blocks = sys.getallocatedblocks()
+            self.sampled = self.frames
+
+    def sample(self, game):
+        timer = game.timer
+        blocks = sys.getallocatedblocks()
+        # net: blocks freed within the window cancel the ones allocated
+        frames = max(1, self.frames - self.sampled)
+        hits = sum(cache.hits for cache in sprites.caches)
+        lookups = hits + sum(cache.misses for cache in sprites.caches)
+        emitters = [game.player.emitter] + [
+            portal.particle_emitter for portal in game.portals if portal]
+
+        self.values = {
+            'frame': f'{game.clock.get_time():>3d} ms',
+            'update': f'{timer.last("update"):5.2f} ms',
+            'draw': f'{timer.last("draw"):5.2f} ms',
+            'entities': f'{len(game.projectiles):>6d}',
+            'particles': f'{sum(len(e.particles) for e in emitters):>6d}',
+            'pool peak': f'{game.projectiles.peak:>6d}',
+            'pool grow': f'{game.projectiles.grown:>6d}',
+            'channels': f'{game.sound_payer.busy_channels():>6d}',
+            'sprites': f'{hits / lookups if lookups else 0:6.1%}',
+            'net blk/f': f'{(blocks - self.blocks) / frames:>+6.1f}',
+            'quality': f'{game.governor.level if game.governor else 0:>6d}',
+        }
+        self.blocks = blocks
+        self.sampled = self.frames
+
+    def plot(self, game):
+        width, height = self.graph.get_size()
+        scale = height / self.budget
+        frame = min(height, game.clock.get_time() * scale)
+        update = min(frame, game.timer.last('update') * scale)
+        draw = min(frame - update, game.timer.last('draw') * scale)
+
+        self.graph.scroll(-1, 0)
+        x = width - 1
+        self.graph.fill((0, 0, 0, 120), (x, 0, 1, height))
+        bottom = height
+        for size, color in ((update, (0, 200, 0)), (draw, (41, 174, 255)),
+                            (frame - update - draw, (200, 200, 200))):
+            if size >= 1:
+                self.graph.fill(color, (x, bottom - size, 1, size))
+            bottom -= size
+
+    def draw(self, surface, game):
+        if not self.visible:
+            return
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 12)
+
+        if self.frames % self.refresh_every == 0:
+            self.sample(game)
+        self.frames += 1
+        self.plot(game)
+
+        x, y = self.pos
+        self.bounds = surface.blit(self.graph, (x, y))
+        y += self.graph.get_height() + 1
+        for label, value in self.values.items():
+            cached = self.text.get(label)
+            if cached is None or cached[0] != value:
+                rendered = self.font.render(
+                    f'{label:<9} {value}', False, (230, 230, 230))
+                cached = self.text[label] = (value, rendered)
+            self.bounds.union_ip(surface.blit(cached[1], (x, y)))
+            y += cached[1].get_height()
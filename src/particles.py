@@ -0,0 +1,145 @@
+import numpy as np
+import pygame
+
+
+rng = np.random.default_rng()
+# scales every emitter's spawn rate and burst size; lowered under load
+density = 1
+
+
+def seed(value=None):
+    global rng
+    rng = np.random.default_rng(value)
+
+
+def set_density(value):
+    global density
+    density = value
+
+
+class ParticleBuffer:
+    __slots__ = [
+        'pos', 'vel', 'age',
+        'lifetime', 'speed', 'color',
+        'count', 'peak', 'reused', 'grown'
+    ]
+
+    def __init__(self, capacity=64):
+        self.count = 0
+        self.peak = 0
+        self.reused = 0
+        self.grown = 0
+        self.pos = np.zeros((capacity, 2), np.float32)
+        self.vel = np.zeros((capacity, 2), np.float32)
+        self.age = np.zeros(capacity, np.float32)
+        self.lifetime = np.zeros(capacity, np.float32)
+        self.speed = np.zeros(capacity, np.float32)
+        self.color = np.zeros((capacity, 4), np.uint8)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.age)
+
+    def reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        self.grown += 1
+        for name in ('pos', 'vel', 'age', 'lifetime', 'speed', 'color'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, pos, vel, lifetime, speed, color):
+        count = len(pos)
+        if not count:
+            return
+        self.reserve(self.count + count)
+        s = slice(self.count, self.count + count)
+        self.pos[s] = pos
+        self.vel[s] = vel
+        self.age[s] = 0
+        self.lifetime[s] = lifetime
+        self.speed[s] = speed
+        self.color[s] = color
+        self.reused += max(0, min(self.peak, s.stop) - s.start)
+        self.count += count
+        self.peak = max(self.peak, self.count)
+
+    def update(self, dt):
+        n = self.count
+        if not n:
+            return 0
+        age = self.age[:n]
+        age += dt
+        self.pos[:n] += self.vel[:n] * (self.speed[:n] * dt)[:, None]
+
+        alive = age < self.lifetime[:n]
+        if alive.all():
+            return 0
+
+        # compact the survivors to the front of the arrays in one gather
+        keep = np.flatnonzero(alive)
+        m = len(keep)
+        for arr in (self.pos, self.vel, self.age,
+                    self.lifetime, self.speed, self.color):
+            arr[:m] = arr[keep]
+        self.count = m
+        return n - m
+
+    def clear(self):
+        self.count = 0
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'capacity': self.capacity,
+            'peak': self.peak,
+            'reused': self.reused,
+            'grown': self.grown,
+        }
+
+    def alpha(self, fade=False):
+        n = self.count
+        if not fade:
+            return self.color[:n, 3]
+        remaining = 1 - self.age[:n] / self.lifetime[:n]
+        return (np.clip(remaining, 0, 1) * self.color[:n, 3]).astype(np.uint8)
+
+
+def draw(surface, pos, color, alpha, dirty=None):
+    rasterize(surface, pos, color, alpha)
+    if dirty:
+        dirty.mark_points(pos)
+
+
+def rasterize(surface, pos, color, alpha):
+    if not len(pos):
+        return
+    w, h = surface.get_size()
+    x, y = pos.astype(np.intp).T
+    inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    if not inside.all():
+        x, y = x[inside], y[inside]
+        color, alpha = color[inside], alpha[inside]
+
+    a = alpha / 255
+    # overlapping particles resolve to the last one written to the pixel
+    rgb = pygame.surfarray.pixels3d(surface)
+    if surface.get_flags() & pygame.SRCALPHA:
+        dst_alpha = pygame.surfarray.pixels_alpha(surface)
+        da = dst_alpha[x, y] / 255
+        dst_alpha[x, y] = (a + da * (1 - a)) * 255
+        del dst_alpha
+        # like pygame's blitter, fully transparent pixels take the source
+        a = np.where(da > 0, a, 1)
+
+    dst = rgb[x, y].astype(np.float32)
+    rgb[x, y] = dst + (color[:, :3] - dst) * a[:, None]
+    del rgb
@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+from pygame import Vector2
+
+from . import chunks
+from . import particles
+from .entities import Player
+from .entities import Portal
+
+
+# everything needed to draw one tick, copied out of the live objects so
+# it can be drawn while the next tick is simulated; positions are already
+# relative to the view
+class Scene:
+    __slots__ = [
+        'stamp', 'shake', 'view', 'sprites', 'player', 'mpos',
+        'player_particles', 'portals', 'ready'
+    ]
+
+    def __init__(self):
+        self.ready = False
+
+    def capture(self, game, stamp):
+        alpha = game.alpha
+        player = game.player
+        self.stamp = stamp
+        self.shake = Vector2(game.screen_shake)
+        self.view = pygame.Rect(game.view)
+        offset = Vector2(self.view.topleft)
+        # the stores are only used to look sprites up, on the drawing side
+        self.sprites = [
+            (store, store.sprites(
+                alpha, store.tier_rows(chunks.NEAR), self.view))
+            for store in game.projectiles
+        ]
+        self.player = player.prev_pos.lerp(player.pos, alpha) - offset
+        self.mpos = game.mpos - offset
+        self.player_particles = player.emitter.render_list(offset)
+        # sprites are looked up when drawing, the caches aren't shared
+        # across threads
+        self.portals = [
+            (portal.pos - offset, *portal.sprite_key(),
+             portal.particle_emitter.render_list(offset))
+            for portal in game.visible_portals()
+        ]
+        self.ready = True
+
+    def draw(self, surface, dirty=None, zoom=1):
+        # zoom scales view space down to a lower resolution surface
+        for store, (pos, angle, scale) in self.sprites:
+            store.blit(surface, pos * zoom, angle, scale * zoom, dirty)
+        pos, color, alpha = self.player_particles
+        particles.draw(surface, pos * zoom, color, alpha, dirty)
+        Player.draw_body(surface, self.player * zoom, self.mpos * zoom, dirty)
+        for pos, angle, variant, (emitted, color, alpha) in self.portals:
+            particles.draw(surface, emitted * zoom, color, alpha, dirty)
+            surf = Portal.sprites.get(angle, zoom, variant=variant)
+            rect = surface.blit(
+                surf, pos * zoom - Vector2(surf.get_size()) / 2)
+            if dirty:
+                dirty.mark_rect(rect)
+
+
+# tick N+1 is simulated on a worker thread while tick N's scene is drawn
+# on this one, so a frame's input reaches the screen one frame later
+class Pipeline:
+    __slots__ = ['game', 'source', 'controls', 'pool', 'pending',
+                 'front', 'back']
+
+    def __init__(self, game):
+        self.game = game
+        # input is polled here on the main thread, as SDL requires, and
+        # handed to the worker through poll()
+        self.source = game.input_source
+        game.input_source = self
+        game.pipeline = self
+        self.controls = None
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix='simulate')
+        self.pending = None
+        self.front = Scene()
+        self.back = Scene()
+
+    def poll(self):
+        return self.controls
+
+    def simulate(self, tdt, stamp):
+        with self.game.profile_capture.on_worker():
+            self.game.simulate(tdt)
+            self.back.capture(self.game, stamp)
+
+    def tick(self, tdt=None):
+        game = self.game
+        if tdt is None:
+            tdt = game.clock.tick(game.max_fps) * 0.001
+        controls = self.source.poll()
+        stamp = time.perf_counter()
+
+        if self.pending is not None:
+            self.pending.result()
+            self.front, self.back = self.back, self.front
+            game.end_frame()
+
+        # zoom and UI keys are handled here, between ticks, while the
+        # worker is idle; the events stay in controls so the worker's
+        # recorder still logs them
+        game.process_ui_events(controls.events)
+
+        self.controls = controls
+        self.pending = self.pool.submit(self.simulate, tdt, stamp)
+
+        if game.render and self.front.ready:
+            with game.timer.phase('draw'):
+                game.draw(self.front)
+            game.timer.add('latency', time.perf_counter() - self.front.stamp)
+
+    def close(self):
+        if self.pending is not None:
+            self.pending.result()
+        self.pool.shutdown()
+        self.game.input_source = self.source
+        self.game.pipeline = None
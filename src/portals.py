@@ -0,0 +1,58 @@
+import numpy as np
+
+from .sweep import first_hits
+from .sweep import segment_segment
+
+
+class PortalNetwork:
+    __slots__ = [
+        'portals', 'start', 'end', 'normal',
+        'exit', 'dest', 'boxes'
+    ]
+
+    def __init__(self, portals=()):
+        self.rebuild(portals)
+
+    def __len__(self):
+        return len(self.portals)
+
+    def rebuild(self, portals, pad=1):
+        # portals are linked in pairs: 0 <-> 1, 2 <-> 3, ...
+        linked = [
+            i for i, portal in enumerate(portals)
+            if portal and (i ^ 1) < len(portals) and portals[i ^ 1]
+        ]
+        for i, portal in enumerate(portals):
+            if portal:
+                portal.active = i in linked
+
+        index = {i: k for k, i in enumerate(linked)}
+        self.portals = [portals[i] for i in linked]
+        self.dest = np.array([index[i ^ 1] for i in linked], np.intp)
+        self.start = np.array(
+            [p.line[0] for p in self.portals], np.float32).reshape(-1, 2)
+        self.end = np.array(
+            [p.line[1] for p in self.portals], np.float32).reshape(-1, 2)
+        self.normal = np.array(
+            [p.normal for p in self.portals], np.float32).reshape(-1, 2)
+        self.exit = np.array(
+            [p.exit for p in self.portals], np.float32).reshape(-1, 2)
+        self.boxes = np.concatenate((
+            np.minimum(self.start, self.end) - pad,
+            np.maximum(self.start, self.end) + pad
+        ), axis=1)
+
+    def crossings(self, start, end):
+        # swept test of each entity's motion this step against every portal
+        empty = np.empty(0, np.intp)
+        if not len(self.portals) or not len(start):
+            return empty, empty, np.empty(0)
+        return first_hits(segment_segment(start, end, self.start, self.end))
+
+    def transfer(self, pos, vel, rows, src):
+        dest = self.dest[src]
+        pos[rows] = self.exit[dest]
+        out = vel[rows] + self.normal[src] + self.normal[dest]
+        length = np.hypot(out[:, 0], out[:, 1])
+        vel[rows] = out / np.where(length > 0, length, 1)[:, None]
+        return dest
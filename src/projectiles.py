@@ -0,0 +1,298 @@
+import random
+
+import numpy as np
+
+from .sweep import ordered_hits
+from .sweep import segment_box
+
+
+# dense columns for the projectiles of one kind; see registry.Registry
+# for the handles that find them again
+class ProjectileStore:
+    __slots__ = [
+        'kind',
+        'pos', 'prev_pos', 'vel', 'speed', 'base_speed',
+        'life', 'max_life', 'rot_speed', 'damping', 'slot',
+        'count', 'peak', 'reused', 'grown', 'splits'
+    ]
+
+    names = ('pos', 'prev_pos', 'vel', 'speed', 'base_speed', 'life',
+             'max_life', 'rot_speed', 'damping', 'slot')
+
+    def __init__(self, kind, capacity=1024):
+        self.kind = kind
+        # rows are recycled in place; these track how well that works
+        self.count = 0
+        self.peak = 0
+        self.reused = 0
+        self.grown = 0
+        # rows are kept sorted by tier, see partition(); these are where
+        # the second and third tiers start
+        self.splits = [0, 0]
+        self.pos = np.zeros((capacity, 2), np.float32)
+        self.prev_pos = np.zeros((capacity, 2), np.float32)
+        self.vel = np.zeros((capacity, 2), np.float32)
+        self.speed = np.zeros(capacity, np.float32)
+        self.base_speed = np.zeros(capacity, np.float32)
+        self.life = np.zeros(capacity, np.float32)
+        self.max_life = np.zeros(capacity, np.float32)
+        self.rot_speed = np.zeros(capacity, np.float32)
+        self.damping = np.zeros(capacity, np.float32)
+        # the registry's handle slot for each row
+        self.slot = np.full(capacity, -1, np.int32)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self.life)
+
+    def columns(self):
+        return tuple(getattr(self, name) for name in self.names)
+
+    def reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < size:
+            capacity *= 2
+        self.grown += 1
+        for name in self.names:
+            old = getattr(self, name)
+            new = np.zeros((capacity, *old.shape[1:]), old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, pos, vel, slot=-1):
+        self.reserve(self.count + 1)
+        i = self.count
+        kind = self.kind
+        speed = random.randint(*kind.speed)
+        self.pos[i] = pos
+        self.prev_pos[i] = pos
+        self.vel[i] = vel
+        self.speed[i] = speed
+        self.base_speed[i] = speed
+        self.life[i] = kind.life
+        self.max_life[i] = kind.life
+        self.rot_speed[i] = random.uniform(*kind.rot_speed)
+        self.damping[i] = kind.damping
+        self.slot[i] = slot
+        self.count += 1
+        if i < self.peak:
+            self.reused += 1
+        else:
+            self.peak = self.count
+        return i
+
+    def partition(self, tiers):
+        # stable sort of the rows by tier, so each tier is one slice;
+        # rows spawned afterwards join the last tier
+        n = self.count
+        counts = np.bincount(tiers, minlength=3)
+        self.splits = np.cumsum(counts)[:2].tolist()
+        if np.all(tiers[1:] >= tiers[:-1]):
+            return False
+        order = np.argsort(tiers, kind='stable')
+        for column in self.columns():
+            column[:n] = column[order]
+        return True
+
+    def tier_rows(self, tier):
+        bounds = [0, *self.splits, self.count]
+        return slice(bounds[tier], bounds[tier + 1])
+
+    def update(self, dt, bounds, portal_boxes=(), level=None, rows=None):
+        # rows limits the update to one slice; returned indices are global
+        first, stop, _ = (rows or slice(None)).indices(self.count)
+        empty = np.empty(0, np.intp)
+        if stop <= first:
+            return empty, empty, empty
+        rows = slice(first, stop)
+
+        pos, vel, speed = self.pos[rows], self.vel[rows], self.speed[rows]
+        self.prev_pos[rows] = pos
+        pos += vel * (speed * dt)[:, None]
+        life = self.life[rows]
+        life -= dt
+        speed *= 1 - dt * self.damping[rows]
+
+        if level is not None:
+            prev = self.prev_pos[rows]
+            # anything spawned inside a wall is dropped rather than tunnelling
+            life[level.solid_at(prev[:, 0], prev[:, 1])] = -1
+
+        alive = life >= 0
+        expired = np.flatnonzero(~alive)
+
+        # reflect off walls and bounds, one ricochet event per axis hit
+        ricochets = []
+        if level is not None:
+            start = prev
+            move = pos - prev
+            fast = np.flatnonzero(
+                alive & (np.abs(move).max(axis=1) > level.tile_size / 4))
+            if len(fast):
+                # sweep fast rows up to the wall so they cannot tunnel
+                toi, spacing = level.first_solid(prev[fast], pos[fast])
+                blocked = np.isfinite(toi)
+                fast, toi = fast[blocked], toi[blocked]
+                start = prev.copy()
+                start[fast] = prev[fast] + move[fast] * (toi - spacing)[:, None]
+                pos[fast] = prev[fast] + move[fast] * toi[:, None]
+
+            hit = alive & level.solid_at(pos[:, 0], start[:, 1])
+            if hit.any():
+                pos[hit, 0] = start[hit, 0]
+                vel[hit, 0] *= -1
+                ricochets.append(np.flatnonzero(hit))
+            hit = alive & level.solid_at(pos[:, 0], pos[:, 1])
+            if hit.any():
+                pos[hit, 1] = start[hit, 1]
+                vel[hit, 1] *= -1
+                ricochets.append(np.flatnonzero(hit))
+        for axis in (0, 1):
+            p = pos[:, axis]
+            out = ~((0 < p) & (p < bounds[axis])) & alive
+            if out.any():
+                p[out] = np.where(p[out] < 0, 0, bounds[axis])
+                vel[out, axis] *= -1
+                ricochets.append(np.flatnonzero(out))
+        ricochets = np.concatenate(ricochets) if ricochets else empty
+
+        if len(portal_boxes):
+            # rows whose motion this step overlaps a portal's bounds
+            boxes = np.asarray(portal_boxes)
+            prev = self.prev_pos[rows]
+            lo, hi = np.minimum(prev, pos), np.maximum(prev, pos)
+            near = (
+                (boxes[:, 0] <= hi[:, :1]) & (lo[:, :1] <= boxes[:, 2]) &
+                (boxes[:, 1] <= hi[:, 1:]) & (lo[:, 1:] <= boxes[:, 3])
+            ).any(axis=1)
+            candidates = np.flatnonzero(near & alive)
+        else:
+            candidates = empty
+
+        return ricochets + first, expired + first, candidates + first
+
+    def sweep_rect(self, prev_center, center, half, rows=None):
+        # rows is a slice or an array of row indices
+        if isinstance(rows, np.ndarray):
+            index = rows
+        else:
+            index = None
+            start, stop, _ = (rows or slice(None)).indices(self.count)
+            rows = slice(start, stop)
+        # work in the target's frame so its own motion is swept as well
+        p0 = self.prev_pos[rows] - tuple(prev_center)
+        p1 = self.pos[rows] - tuple(center)
+        # projectile rects are 2x2, so grow the target by 1 on each side
+        extent = np.add(half, 1)
+        toi = segment_box(p0, p1, -extent, extent)
+        toi[self.life[rows] < 0] = np.inf
+        hits, _ = ordered_hits(toi)
+        return hits + start if index is None else index[hits]
+
+    def remove(self, rows):
+        # swap-remove: a tier's last rows fill its holes and the tiers
+        # above slide down into the gap, so the cost follows how many are
+        # removed rather than how many are stored. Returns the rows that
+        # now hold a moved projectile
+        rows = np.unique(rows)
+        if not len(rows):
+            return rows
+        bounds = [0, *self.splits, self.count]
+        dest, src, ends = [], [], []
+        start = 0
+        for a, b in zip(bounds, bounds[1:]):
+            lo, hi = np.searchsorted(rows, (a, b))
+            gone = rows[lo:hi]
+            end = start + (b - a) - len(gone)
+            # the tier moves to [start, end): what the tiers below gave up
+            # and its own removed rows are free, its survivors past end
+            # move into them
+            dest.append(np.arange(start, min(a, end)))
+            dest.append(gone[gone < end])
+            tail = np.arange(max(a, end), b)
+            src.append(tail[~np.isin(tail, gone)])
+            ends.append(end)
+            start = end
+        dest = np.concatenate(dest)
+        src = np.concatenate(src)
+        for column in self.columns():
+            column[dest] = column[src]
+        self.splits = ends[:2]
+        self.count = ends[2]
+        return dest
+
+    def clear(self):
+        self.count = 0
+        self.splits = [0, 0]
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'capacity': self.capacity,
+            'peak': self.peak,
+            'reused': self.reused,
+            'grown': self.grown,
+        }
+
+    def snap(self, rows):
+        self.prev_pos[rows] = self.pos[rows]
+
+    def sprites(self, alpha=1, rows=None, view=None):
+        # what to draw, as fresh arrays that later updates don't touch;
+        # with a view, only rows near it, in view space
+        rows = rows or slice(0, self.count)
+        pos = self.pos[rows].copy()
+        if alpha < 1:
+            prev = self.prev_pos[rows]
+            pos = prev + (pos - prev) * alpha
+        if view is not None:
+            pos -= view.topleft
+            pad = 16
+            inside = np.flatnonzero(
+                (-pad < pos[:, 0]) & (pos[:, 0] < view.w + pad) &
+                (-pad < pos[:, 1]) & (pos[:, 1] < view.h + pad))
+            pos = pos[inside]
+            rows = inside + (rows.start or 0)
+        vel = self.vel[rows]
+        angle = (
+            np.degrees(np.arctan2(vel[:, 1], vel[:, 0])) +
+            self.kind.sprite_offset -
+            360 * (self.speed[rows] / self.base_speed[rows]) *
+            self.rot_speed[rows]
+        )
+        scale = self.life[rows] / self.max_life[rows]
+        return pos, angle, scale
+
+    def draw(self, surface, alpha=1, dirty=None, rows=None, view=None):
+        if self.count:
+            self.blit(surface, *self.sprites(alpha, rows, view), dirty)
+
+    def blit(self, surface, pos, angle, scale, dirty=None):
+        if not len(pos):
+            return
+        cache = self.kind.sprites
+        angle_bucket = np.round(angle / cache.angle_step).astype(np.int64)
+        scale_bucket = np.round(scale / cache.scale_step).astype(np.int64)
+        # one cache lookup per distinct sprite instead of per projectile
+        keys, inverse = np.unique(
+            angle_bucket * 4096 + scale_bucket, return_inverse=True)
+        surfs = [
+            cache.get((key // 4096) * cache.angle_step,
+                      (key % 4096) * cache.scale_step)
+            for key in keys.tolist()
+        ]
+        half = np.array([s.get_size() for s in surfs], np.float32) / 2
+        topleft = pos - half[inverse]
+        if dirty:
+            x, y = topleft[:, 0], topleft[:, 1]
+            size = half[inverse] * 2
+            dirty.mark_boxes(x, y, x + size[:, 0], y + size[:, 1])
+        surface.blits(zip(
+            [surfs[i] for i in inverse.tolist()],
+            topleft.tolist()
+        ), doreturn=False)
@@ -0,0 +1,114 @@
+import numpy as np
+
+from .projectiles import ProjectileStore
+
+
+# one dense store per kind (an archetype), and handles that keep finding
+# an entity while swap-removes and re-sorts move it between rows.
+# Systems pick the stores they apply to with query() instead of masking
+# every row by kind
+class Registry:
+    __slots__ = [
+        'stores', 'index', 'generation', 'location', 'free', 'slots',
+        'peak'
+    ]
+
+    def __init__(self, kinds, capacity=1024):
+        self.stores = [ProjectileStore(kind, capacity) for kind in kinds]
+        self.index = {kind: i for i, kind in enumerate(kinds)}
+        slots = capacity * len(self.stores)
+        # per handle slot: bumped on every removal, so stale handles miss
+        self.generation = np.zeros(slots, np.uint32)
+        # per handle slot: store index and row, -1 when free
+        self.location = np.full((slots, 2), -1, np.int32)
+        self.free = []
+        self.slots = 0
+        self.peak = 0
+
+    def __len__(self):
+        return sum(store.count for store in self.stores)
+
+    def __iter__(self):
+        return iter(self.stores)
+
+    @property
+    def kinds(self):
+        return [store.kind for store in self.stores]
+
+    @property
+    def grown(self):
+        return sum(store.grown for store in self.stores)
+
+    def store(self, kind):
+        return self.stores[self.index[kind]]
+
+    def query(self, flag):
+        # the stores whose kind sets flag, e.g. 'collides'
+        return [store for store in self.stores if getattr(store.kind, flag)]
+
+    def reserve(self, size):
+        capacity = len(self.generation)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        generation = np.zeros(capacity, np.uint32)
+        generation[:self.slots] = self.generation[:self.slots]
+        location = np.full((capacity, 2), -1, np.int32)
+        location[:self.slots] = self.location[:self.slots]
+        self.generation, self.location = generation, location
+
+    def spawn(self, kind, pos, vel):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = self.slots
+            self.reserve(slot + 1)
+            self.slots += 1
+        index = self.index[kind]
+        row = self.stores[index].spawn(pos, vel, slot)
+        self.location[slot] = index, row
+        self.peak = max(self.peak, len(self))
+        return int(self.generation[slot]) << 32 | slot
+
+    def handles(self, store, rows):
+        slots = store.slot[rows].astype(np.int64)
+        return self.generation[slots].astype(np.int64) << 32 | slots
+
+    def get(self, handle):
+        # (store, row) for a live handle, None once it has been removed
+        slot, generation = handle & 0xffffffff, handle >> 32
+        if slot >= self.slots or self.generation[slot] != generation:
+            return None
+        index, row = self.location[slot].tolist()
+        return self.stores[index], row
+
+    def remove(self, store, rows):
+        rows = np.unique(rows)
+        if not len(rows):
+            return
+        slots = store.slot[rows]
+        self.generation[slots] += 1
+        self.location[slots] = -1
+        self.free.extend(slots.tolist())
+        moved = store.remove(rows)
+        self.location[store.slot[moved], 1] = moved
+
+    def partition(self, store, tiers):
+        if store.partition(tiers):
+            n = store.count
+            self.location[store.slot[:n], 1] = np.arange(n)
+
+    def stats(self):
+        stores = {
+            store.kind.__name__: store.stats() for store in self.stores
+        }
+        return {
+            'count': len(self),
+            'capacity': sum(s['capacity'] for s in stores.values()),
+            'peak': self.peak,
+            'reused': sum(s['reused'] for s in stores.values()),
+            'grown': self.grown,
+            'handles': self.slots,
+            'kinds': stores,
+        }
@@ -0,0 +1,69 @@
+import numpy as np
+import pygame
+
+
+class DirtyTiles:
+    __slots__ = ['tile', 'size', 'shape', 'current', 'previous', 'full']
+
+    def __init__(self, size, tile=16):
+        self.tile = tile
+        self.resize(size)
+
+    def resize(self, size):
+        self.size = (int(size[0]), int(size[1]))
+        self.shape = (
+            -(-self.size[0] // self.tile),
+            -(-self.size[1] // self.tile)
+        )
+        self.current = np.zeros(self.shape, bool)
+        self.previous = np.zeros(self.shape, bool)
+        self.full = True
+
+    def invalidate(self):
+        self.full = True
+
+    def mark_rect(self, rect):
+        rect = pygame.Rect(rect)
+        self.mark_boxes(rect.left, rect.top, rect.right, rect.bottom)
+
+    def mark_boxes(self, x0, y0, x1, y1):
+        w, h = self.shape
+        t = self.tile
+        tx0 = np.clip(np.floor_divide(x0, t), 0, w - 1).astype(np.intp)
+        ty0 = np.clip(np.floor_divide(y0, t), 0, h - 1).astype(np.intp)
+        tx1 = np.clip(np.floor_divide(x1, t), 0, w - 1).astype(np.intp)
+        ty1 = np.clip(np.floor_divide(y1, t), 0, h - 1).astype(np.intp)
+        if tx0.ndim == 0:
+            self.current[tx0:tx1 + 1, ty0:ty1 + 1] = True
+            return
+        # boxes are smaller than a tile, so the corners cover every tile
+        self.current[tx0, ty0] = True
+        self.current[tx1, ty0] = True
+        self.current[tx0, ty1] = True
+        self.current[tx1, ty1] = True
+
+    def mark_points(self, pos, pad=1):
+        if len(pos):
+            x, y = pos[:, 0], pos[:, 1]
+            self.mark_boxes(x - pad, y - pad, x + pad, y + pad)
+
+    def coverage(self):
+        return (self.current | self.previous).mean()
+
+    def rects(self):
+        dirty = self.current | self.previous
+        t = self.tile
+        rects = []
+        # merge each row of tiles into horizontal runs
+        for ty in np.flatnonzero(dirty.any(axis=0)).tolist():
+            row = np.concatenate(([False], dirty[:, ty], [False]))
+            edges = np.flatnonzero(row[1:] != row[:-1])
+            for start, end in zip(edges[::2].tolist(), edges[1::2].tolist()):
+                rect = pygame.Rect(start * t, ty * t, (end - start) * t, t)
+                rects.append(rect.clip((0, 0), self.size))
+        return rects
+
+    def swap(self):
+        self.previous, self.current = self.current, self.previous
+        self.current[:] = False
+        self.full = False
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame  # noqa: E402
+
+from . import particles  # noqa: E402
+from .inputs import InputState  # noqa: E402
+from .inputs import KeySet  # noqa: E402
+
+
+MAGIC = b'PSRP'
+VERSION = 1
+# magic, version, seed, length of the level path that follows
+HEADER = struct.Struct('<4sHQH')
+# frame time, mouse x/y, button bits, held key bits, event count
+TICK = struct.Struct('<dffBBB')
+# event kind and its value
+EVENT = struct.Struct('<Bi')
+KEYDOWN, WHEEL, QUIT = range(3)
+
+# the only held keys the simulation reads
+KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d)
+
+
+def seed(value):
+    random.seed(value)
+    particles.seed(value)
+
+
+class Recorder:
+    __slots__ = ['file', 'ticks', 'flush_every']
+
+    def __init__(self, path, seed, level='', flush_every=60):
+        self.file = open(path, 'wb')
+        self.ticks = 0
+        self.flush_every = flush_every
+        level = level.encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed, len(level)))
+        self.file.write(level)
+
+    def write(self, state, tdt):
+        events = []
+        for event in state.events:
+            if event.type == pygame.KEYDOWN:
+                events.append(EVENT.pack(KEYDOWN, event.key))
+            elif event.type == pygame.MOUSEWHEEL:
+                events.append(EVENT.pack(WHEEL, event.y))
+            elif event.type == pygame.QUIT:
+                events.append(EVENT.pack(QUIT, 0))
+        buttons = sum(bool(b) << i for i, b in enumerate(state.buttons[:3]))
+        keys = sum(bool(state.keys[k]) << i for i, k in enumerate(KEYS))
+        self.file.write(TICK.pack(
+            tdt, *state.mouse, buttons, keys, len(events)))
+        self.file.write(b''.join(events))
+
+        self.ticks += 1
+        if self.ticks % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ReplayInput:
+    __slots__ = ['file', 'seed', 'level', 'tick', 'pending', 'offsets']
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        magic, version, self.seed, size = HEADER.unpack(
+            self.file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} replay')
+        self.level = self.file.read(size).decode()
+        self.tick = 0
+        self.pending = None
+        # file offset of every tick read so far, for seeking back
+        self.offsets = []
+
+    def read(self):
+        if self.pending is None:
+            offset = self.file.tell()
+            data = self.file.read(TICK.size)
+            if len(data) < TICK.size:
+                return None
+            tdt, x, y, buttons, keys, count = TICK.unpack(data)
+            events = []
+            for _ in range(count):
+                kind, value = EVENT.unpack(self.file.read(EVENT.size))
+                if kind == KEYDOWN:
+                    events.append(pygame.event.Event(pygame.KEYDOWN, key=value))
+                elif kind == WHEEL:
+                    events.append(pygame.event.Event(
+                        pygame.MOUSEWHEEL, x=0, y=value))
+                else:
+                    events.append(pygame.event.Event(pygame.QUIT))
+            state = InputState(
+                (x, y),
+                [bool(buttons >> i & 1) for i in range(3)],
+                KeySet(k for i, k in enumerate(KEYS) if keys >> i & 1),
+                events
+            )
+            if self.tick == len(self.offsets):
+                self.offsets.append(offset)
+            self.pending = (tdt, state)
+        return self.pending
+
+    def next_tdt(self):
+        pending = self.read()
+        return None if pending is None else pending[0]
+
+    def poll(self):
+        pending = self.read()
+        self.pending = None
+        self.tick += 1
+        return pending[1]
+
+    def rewind(self, tick):
+        self.file.seek(self.offsets[tick])
+        self.tick = tick
+        self.pending = None
+
+    def close(self):
+        self.file.close()
+
+
+class Replay:
+    __slots__ = [
+        'game', 'input', 'snapshot_every', 'snapshots', 'ticks', 'tdt'
+    ]
+
+    def __init__(self, path, fast=False, snapshot_every=600):
+        from .main import Game
+
+        self.input = ReplayInput(path)
+        seed(self.input.seed)
+        self.game = Game(headless=fast, input_source=self.input,
+                         level=self.input.level or None)
+        # quality changes alter the simulation, and none were recorded
+        self.game.governor = None
+        # fast-forward only simulates: no drawing and no audio
+        self.game.render = not fast
+        self.snapshot_every = snapshot_every
+        # (tick, snapshot) taken before that tick ran
+        self.snapshots = []
+        self.ticks = 0
+        self.tdt = 0
+
+    def step(self):
+        tdt = self.input.next_tdt()
+        if tdt is None or not self.game.running:
+            return False
+        tick = self.input.tick
+        if tick % self.snapshot_every == 0 and (
+                not self.snapshots or self.snapshots[-1][0] < tick):
+            self.snapshots.append((tick, self.game.snapshot()))
+        self.game.tick(tdt)
+        self.tdt = tdt
+        self.ticks = max(self.ticks, self.input.tick)
+        return True
+
+    def seek(self, tick):
+        # restore the closest snapshot at or before tick, then simulate
+        # the rest of the way without drawing
+        earlier = [s for s in self.snapshots if s[0] <= tick]
+        if earlier and tick < self.input.tick:
+            start, snapshot = earlier[-1]
+            self.game.restore(snapshot)
+            self.input.rewind(start)
+        render, self.game.render = self.game.render, False
+        while self.input.tick < tick and self.step():
+            pass
+        self.game.render = render
+        self.game.dirty.invalidate()
+
+    def close(self):
+        self.game.sound_payer.close()
+        self.input.close()
+
+    def run(self, until=None):
+        game = self.game
+        while (until is None or self.input.tick < until) and self.step():
+            if game.render and self.tdt > 0:
+                # pace playback to the recorded frame times
+                game.clock.tick(1 / self.tdt)
+
+
+def record(path, seed_value=None, level='./maps/level1.txt'):
+    from .main import Game
+
+    if seed_value is None:
+        seed_value = random.randrange(2 ** 32)
+    seed(seed_value)
+    game = Game(level=level)
+    # quality changes alter the simulation and are not logged, so a
+    # governed recording would not replay the same
+    game.governor = None
+    game.recorder = Recorder(path, seed_value, level)
+    game.run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Record a session or play one back')
+    commands = parser.add_subparsers(dest='command', required=True)
+    rec = commands.add_parser('record')
+    rec.add_argument('path')
+    rec.add_argument('--seed', type=int)
+    play = commands.add_parser('play')
+    play.add_argument('path')
+    play.add_argument('--fast', action='store_true',
+                      help='simulate only, as fast as possible, and report')
+    play.add_argument('--seek', type=int, default=0,
+                      help='fast-forward to this tick before playing')
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record(args.path, args.seed)
+        return
+
+    replay = Replay(args.path, fast=args.fast)
+    replay.seek(args.seek)
+    start = time.perf_counter()
+    try:
+        replay.run()
+    finally:
+        replay.close()
+    wall = time.perf_counter() - start
+    if args.fast:
+        game = replay.game
+        ticks = max(1, replay.ticks - args.seek)
+        json.dump({
+            'ticks': replay.ticks,
+            'seed': replay.input.seed,
+            'wall_ms': wall * 1000,
+            'ms_per_tick': wall * 1000 / ticks,
+            'final': {
+                'projectiles': len(game.projectiles),
+                'health': game.player.health,
+                'pos': list(game.player.pos),
+            },
+        }, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
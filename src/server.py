@@ -0,0 +1,492 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np  # noqa: E402
+import pygame  # noqa: E402
+from pygame import Vector2  # noqa: E402
+
+from . import netcode  # noqa: E402
+from .chunks import ChunkGrid  # noqa: E402
+from .chunks import ChunkIndex  # noqa: E402
+from .entities import Bullet  # noqa: E402
+from .entities import Player  # noqa: E402
+from .entities import Portal  # noqa: E402
+from .entities import Shell  # noqa: E402
+from .instrument import PhaseTimer  # noqa: E402
+from .level import Level  # noqa: E402
+from .portals import PortalNetwork  # noqa: E402
+from .registry import Registry  # noqa: E402
+
+
+PORTAL_COLORS = ((255, 127, 0), (41, 174, 255))
+
+
+# a player and the latest input its client sent
+class Avatar:
+    __slots__ = ['player', 'aim', 'buttons', 'held', 'presses', 'shot_timer']
+
+    def __init__(self, pos):
+        self.player = Player(pos, Vector2())
+        self.aim = Vector2()
+        self.buttons = (False, False, False)
+        self.held = ()
+        # presses queue up until the next tick applies them
+        self.presses = []
+        self.shot_timer = 0
+
+
+# the shared simulation: many players, one pair of portals anyone can
+# place, and the same projectile stores the single player game uses
+class World:
+    def __init__(self, level, seed=0, fire_rate=1/40, capacity=4096):
+        self.level = level
+        self.size = Vector2(level.size)
+        self.rng = random.Random(seed)
+        self.projectiles = Registry((Bullet, Shell), capacity)
+        self.portals = [None, None]
+        self.portal_network = PortalNetwork()
+        self.portal_width = 12
+        self.fire_rate = fire_rate
+        self.avatars = {}
+        self.counters = {'hits': 0, 'deaths': 0, 'traversals': 0}
+
+    def spawn_point(self):
+        while True:
+            pos = (self.rng.uniform(0, self.size.x),
+                   self.rng.uniform(0, self.size.y))
+            if not self.level.solid_at(*pos):
+                return pos
+
+    def join(self, client):
+        avatar = self.avatars[client] = Avatar(self.spawn_point())
+        return avatar
+
+    def leave(self, client):
+        self.avatars.pop(client, None)
+
+    def step(self, dt):
+        for avatar in self.avatars.values():
+            self.control(avatar, dt)
+
+        for avatar in self.avatars.values():
+            player = avatar.player
+            player.prev_pos = Vector2(player.pos)
+            # moved on both sides of the portal test, as Game.step does
+            player.move(dt, self.size, self.level)
+            self.do_portal(player)
+            player.move(dt, self.size, self.level)
+
+        registry = self.projectiles
+        dead = {}
+        for store in registry:
+            boxes = self.portal_network.boxes if store.kind.portals else ()
+            _, expired, candidates = store.update(
+                dt, self.size, boxes, self.level)
+            dead[store] = [expired]
+            if len(candidates):
+                rows, src, _ = self.portal_network.crossings(
+                    store.prev_pos[candidates], store.pos[candidates])
+                if len(rows):
+                    rows = candidates[rows]
+                    self.portal_network.transfer(
+                        store.pos, store.vel, rows, src)
+                    store.snap(rows)
+                    self.counters['traversals'] += len(rows)
+
+        for store in registry.query('collides'):
+            dead[store].append(self.collide(store))
+
+        for store, rows in dead.items():
+            registry.remove(store, np.concatenate(rows))
+
+    def control(self, avatar, dt):
+        player = avatar.player
+        target = player.pos + avatar.aim
+        for key in avatar.presses:
+            if key in (pygame.K_q, pygame.K_e):
+                i = int(key == pygame.K_e)
+                if avatar.aim:
+                    self.set_portal(i, Portal(
+                        target, avatar.aim, PORTAL_COLORS[i],
+                        self.portal_width))
+            else:
+                self.set_portal(int(key == pygame.K_x), None)
+        avatar.presses = []
+
+        player.vel = Vector2()
+        held = avatar.held
+        if pygame.K_w in held:
+            player.vel.y -= player.speed
+        if pygame.K_s in held:
+            player.vel.y += player.speed
+        if pygame.K_a in held:
+            player.vel.x -= player.speed
+        if pygame.K_d in held:
+            player.vel.x += player.speed
+
+        avatar.shot_timer = max(0, avatar.shot_timer - dt)
+        if avatar.buttons[0] and not avatar.shot_timer and avatar.aim:
+            fire_vec = avatar.aim.normalize()
+            self.projectiles.spawn(
+                Bullet, player.pos + fire_vec * 15, fire_vec)
+            eject_vec = Vector2(-fire_vec.y, fire_vec.x)
+            self.projectiles.spawn(
+                Shell, player.pos + fire_vec * 4 + eject_vec * 4, eject_vec)
+            player.vel = fire_vec * -(self.rng.random() * 4 + 4) * 10
+            avatar.shot_timer = self.fire_rate
+
+    def set_portal(self, index, portal):
+        self.portals[index] = portal
+        self.portal_network.rebuild(self.portals)
+
+    def do_portal(self, player):
+        if not (len(self.portal_network) and player.vel):
+            return
+        pos = np.array([player.pos], np.float32)
+        vel = np.array([player.vel], np.float32)
+        rows, src, _ = self.portal_network.crossings(
+            np.array([player.prev_pos], np.float32), pos)
+        if len(rows):
+            self.portal_network.transfer(pos, vel, rows, src)
+            player.pos = Vector2(pos[0].tolist())
+            player.vel = Vector2(vel[0].tolist())
+            player.prev_pos = Vector2(player.pos)
+            self.counters['traversals'] += 1
+
+    def collide(self, store):
+        # each player only sweeps the projectiles in the chunks around it
+        index = ChunkIndex(store.pos[:store.count], size=64)
+        taken = []
+        for avatar in self.avatars.values():
+            player = avatar.player
+            rows = index.around(player.pos, 16)
+            if not len(rows):
+                continue
+            hits = store.sweep_rect(player.prev_pos, player.pos, (2, 2), rows)
+            if taken:
+                hits = hits[~np.isin(hits, np.concatenate(taken))]
+            if not len(hits):
+                continue
+            taken.append(hits)
+            self.counters['hits'] += len(hits)
+            player.health -= 10 * len(hits)
+            if player.health <= 0:
+                self.counters['deaths'] += 1
+                player.pos = Vector2(self.spawn_point())
+                player.prev_pos = Vector2(player.pos)
+                player.health = player.max_health
+        return np.concatenate(taken) if taken else np.empty(0, np.intp)
+
+    def table(self):
+        # every entity, quantized for the wire, and where it is
+        avatars = list(self.avatars.items())
+        portals = [(i, p) for i, p in enumerate(self.portals) if p]
+        stores = list(self.projectiles)
+        total = len(avatars) + len(portals) + sum(s.count for s in stores)
+        table = np.zeros(total, netcode.ENTITY)
+        pos = np.zeros((total, 2), np.float32)
+
+        n = len(avatars)
+        table['kind'][:n] = netcode.PLAYER
+        table['id'][:n] = [client for client, _ in avatars]
+        # reshaped so an empty list still fills a (0, 2) block
+        pos[:n] = np.reshape(
+            [tuple(a.player.pos) for _, a in avatars], (-1, 2))
+        table['a'][:n] = netcode.quantize_angle([
+            np.degrees(np.arctan2(a.aim.y, a.aim.x)) for _, a in avatars])
+        table['b'][:n] = [
+            min(255, max(0, a.player.health)) for _, a in avatars]
+
+        m = n + len(portals)
+        table['kind'][n:m] = netcode.PORTAL
+        table['id'][n:m] = [i for i, _ in portals]
+        pos[n:m] = np.reshape([tuple(p.pos) for _, p in portals], (-1, 2))
+        table['a'][n:m] = netcode.quantize_angle([
+            np.degrees(np.arctan2(p.perp.y, p.perp.x)) for _, p in portals])
+        table['b'][n:m] = [p.active for _, p in portals]
+
+        start = m
+        for k, store in enumerate(stores):
+            end = start + store.count
+            rows = slice(0, store.count)
+            handles = self.projectiles.handles(store, rows)
+            # the low byte of the generation keeps reused slots apart
+            table['kind'][start:end] = netcode.PORTAL + 1 + k
+            table['id'][start:end] = (
+                (handles >> 32 & 0xff) << 24 | handles & 0xffffff)
+            pos[start:end] = store.pos[rows]
+            vel = store.vel[rows]
+            table['a'][start:end] = netcode.quantize_angle(
+                np.degrees(np.arctan2(vel[:, 1], vel[:, 0])))
+            table['b'][start:end] = np.clip(
+                store.life[rows] / store.max_life[rows] * 255, 0, 255)
+            start = end
+
+        table['x'] = netcode.quantize_pos(pos[:, 0])
+        table['y'] = netcode.quantize_pos(pos[:, 1])
+        return table, pos
+
+
+# one connected client
+class Peer:
+    __slots__ = [
+        'id', 'writer', 'avatar', 'ack', 'history',
+        'sent', 'snapshots', 'full', 'skipped', 'joined', 'left'
+    ]
+
+    def __init__(self, client, writer, avatar):
+        self.id = client
+        self.writer = writer
+        self.avatar = avatar
+        # the last snapshot the client confirmed, the baseline for deltas
+        self.ack = netcode.NO_BASE
+        # tick -> chunk span of the state sent, until the client
+        # acknowledges something newer
+        self.history = {}
+        self.sent = 0
+        self.snapshots = 0
+        self.full = 0
+        self.skipped = 0
+        self.joined = time.perf_counter()
+        self.left = None
+
+
+class Server:
+    # snapshots kept per client for it to acknowledge
+    history = 32
+    # bytes queued to a client before snapshots to it are skipped
+    backlog = 1 << 18
+
+    def __init__(self, world, tick_rate=30, view=(240, 240)):
+        self.world = world
+        self.tick_rate = tick_rate
+        self.view = pygame.Rect((0, 0), view)
+        self.chunks = ChunkGrid(size=256, margin=1)
+        self.peers = {}
+        # tick -> chunk span -> (state, keys) sent to the peers seeing it
+        self.states = {}
+        self.departed = []
+        self.next_id = 1
+        self.tick = 0
+        self.timer = PhaseTimer(size=tick_rate * 60)
+        self.running = True
+
+    async def handle(self, reader, writer):
+        client = self.next_id
+        self.next_id += 1
+        peer = self.peers[client] = Peer(
+            client, writer, self.world.join(client))
+        writer.write(netcode.frame(netcode.HELLO_MSG.pack(
+            netcode.HELLO, client, self.tick_rate,
+            int(self.world.size.x), int(self.world.size.y))))
+        try:
+            while True:
+                _, ack, aim, buttons, held, presses = netcode.decode_input(
+                    await netcode.read_frame(reader))
+                avatar = peer.avatar
+                avatar.aim = Vector2(aim)
+                avatar.buttons = buttons
+                avatar.held = held
+                avatar.presses.extend(presses)
+                peer.ack = ack
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            peer.left = time.perf_counter()
+            self.departed.append(self.peers.pop(client))
+            self.world.leave(client)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=7777, seconds=None,
+                    started=None, log_every=5):
+        server = await asyncio.start_server(self.handle, host, port)
+        if started:
+            started.set_result(server.sockets[0].getsockname()[1])
+        loop = asyncio.get_running_loop()
+        period = 1 / self.tick_rate
+        start = next_tick = loop.time()
+        last_log = start
+        async with server:
+            while self.running and (
+                    seconds is None or loop.time() - start < seconds):
+                self.step()
+                if log_every and loop.time() - last_log >= log_every:
+                    last_log = loop.time()
+                    print(self.summary(), file=sys.stderr)
+                next_tick += period
+                # fall behind rather than try to catch up
+                next_tick = max(next_tick, loop.time() - period)
+                await asyncio.sleep(max(0, next_tick - loop.time()))
+
+    def step(self):
+        with self.timer.phase('tick'):
+            with self.timer.phase('simulate'):
+                self.world.step(1 / self.tick_rate)
+            with self.timer.phase('send'):
+                self.broadcast()
+        self.timer.end_frame()
+        self.tick += 1
+
+    def broadcast(self):
+        if not self.peers:
+            return
+        table, pos = self.world.table()
+        # sorted by key once, so any rows taken in order are sorted too
+        table_keys = netcode.keys(table)
+        order = np.argsort(table_keys, kind='stable')
+        table, pos, table_keys = (
+            np.take(table, order), pos[order], table_keys[order])
+        # portals are few and always sent; the rest by chunk
+        portal = table['kind'] == netcode.PORTAL
+        rest = np.flatnonzero(~portal)
+        index = ChunkIndex(pos[rest], self.chunks.size)
+
+        # peers whose views cover the same chunks get the same state, and
+        # those that also acknowledged the same one get the same payload,
+        # so each is built once per tick rather than once per peer
+        states = self.states[self.tick] = {}
+        for tick in [t for t in self.states
+                     if t < self.tick - self.history]:
+            del self.states[tick]
+        payloads = {}
+        for peer in self.peers.values():
+            if peer.writer.transport.get_write_buffer_size() > self.backlog:
+                peer.skipped += 1
+                continue
+            self.view.center = tuple(peer.avatar.player.pos)
+            lo, hi = self.chunks.span(self.view)
+            span = tuple(lo.tolist()), tuple(hi.tolist())
+            if span not in states:
+                pick = portal.copy()
+                pick[rest[index.query(lo, hi)]] = True
+                rows = np.flatnonzero(pick)
+                # take, as fancy indexing the packed records is slow
+                states[span] = np.take(table, rows), table_keys[rows]
+
+            # what the client has moved past is no use as a baseline
+            oldest = self.tick - self.history
+            if peer.ack != netcode.NO_BASE:
+                oldest = max(oldest, peer.ack)
+            for tick in [t for t in peer.history if t < oldest]:
+                del peer.history[tick]
+            base_span = peer.history.get(peer.ack)
+            base, base_keys = self.states.get(peer.ack, {}).get(
+                base_span, (None, None))
+            key = span, peer.ack, base_span
+            if key not in payloads:
+                state, state_keys = states[span]
+                payloads[key] = netcode.frame(netcode.encode_snapshot(
+                    self.tick, peer.ack, base, state, base_keys, state_keys))
+            peer.history[self.tick] = span
+
+            message = payloads[key]
+            peer.writer.write(message)
+            peer.sent += len(message)
+            peer.snapshots += 1
+            peer.full += base is None
+
+    def summary(self):
+        stats = self.timer.percentiles().get('tick', {})
+        now = time.perf_counter()
+        rates = [p.sent / max(1e-9, now - p.joined)
+                 for p in self.peers.values()]
+        return (f'tick {self.tick} clients {len(self.peers)}'
+                f' entities {len(self.world.projectiles)}'
+                f' tick p50 {stats.get("p50_ms", 0):.2f}ms'
+                f' p95 {stats.get("p95_ms", 0):.2f}ms'
+                f' {np.mean(rates) / 1024 if rates else 0:.1f} KiB/s/client')
+
+    def report(self):
+        now = time.perf_counter()
+        peers = list(self.peers.values()) + self.departed
+        rates = np.array([
+            p.sent / max(1e-9, (p.left or now) - p.joined) for p in peers])
+        snapshots = sum(p.snapshots for p in peers)
+        sent = sum(p.sent for p in peers)
+        return {
+            'ticks': self.tick,
+            'tick_rate': self.tick_rate,
+            'clients': len(peers),
+            'phases': self.timer.report(self.tick),
+            'bytes_per_client_per_s': {
+                'mean': float(rates.mean()) if len(rates) else 0,
+                'max': float(rates.max()) if len(rates) else 0,
+            },
+            'snapshot_bytes': sent / max(1, snapshots),
+            'snapshots': snapshots,
+            'full_snapshots': sum(p.full for p in peers),
+            'skipped_snapshots': sum(p.skipped for p in peers),
+            'entities': len(self.world.projectiles),
+            'counters': dict(self.world.counters),
+        }
+
+
+async def loopback(server, bots, seconds, host='127.0.0.1', port=0):
+    # the bots run in a process of their own so their cost does not
+    # count against the server's ticks
+    started = asyncio.get_running_loop().create_future()
+    serving = asyncio.create_task(
+        server.serve(host, port, started=started, log_every=0))
+    port = await started
+    clients = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'src.client', '--host', host,
+        '--port', str(port), '--bots', str(bots), '--seconds', str(seconds),
+        stdout=asyncio.subprocess.PIPE)
+    out, _ = await clients.communicate()
+    server.running = False
+    await serving
+    if clients.returncode:
+        raise RuntimeError(f'bot clients exited with {clients.returncode}')
+    return json.loads(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run an authoritative multiplayer server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--tick-rate', type=int, default=30)
+    parser.add_argument('--level', help='map file, else a generated arena')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bots', type=int, default=0,
+                        help='run this many bot clients over loopback and'
+                             ' report, instead of serving indefinitely')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--output', help='write the report here')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    if args.level:
+        level = Level.load(args.level, tile_size=30)
+    else:
+        level = Level.arena(100, seed=args.seed, tile_size=30)
+    server = Server(World(level, args.seed), args.tick_rate)
+
+    if not args.bots:
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    clients = asyncio.run(loopback(server, args.bots, args.seconds, args.host))
+    report = {'server': server.report(), 'clients': clients}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+import json
+import mmap
+import random
+import struct
+
+import numpy as np
+from pygame import Vector2
+
+from . import particles
+from .entities import FadeOutParticle
+from .entities import Particle
+from .entities import ParticleEmitter
+from .entities import Player
+from .entities import Portal
+
+
+MAGIC = b'PSSN'
+# magic and the length of the JSON header that follows
+HEADER = struct.Struct('<4sI')
+ALIGN = 64
+
+PARTICLE_CLASSES = {cls.__name__: cls for cls in (Particle, FadeOutParticle)}
+SHAPES = {
+    ParticleEmitter.Point: ('spread', float),
+    ParticleEmitter.Line: ('vec', list),
+    ParticleEmitter.Circle: ('radius', float),
+    ParticleEmitter.Rectangle: ('size', list),
+}
+PROJECTILE_COLUMNS = (
+    'pos', 'prev_pos', 'vel', 'speed', 'base_speed',
+    'life', 'max_life', 'rot_speed', 'damping', 'slot'
+)
+PARTICLE_COLUMNS = ('pos', 'vel', 'age', 'lifetime', 'speed', 'color')
+SCALARS = (
+    'screen_scale', 'time_scale', 'shot_timer', 'player_walk_timer',
+    'accumulator', 'alpha', 'running', 'steps', 'far_dt'
+)
+
+
+# meta holds small JSON values, arrays the per-row state; arrays loaded
+# from a file are read-only views into its memory map
+class Snapshot:
+    __slots__ = ['meta', 'arrays', 'delta']
+
+    def __init__(self, meta, arrays, delta=False):
+        self.meta = meta
+        self.arrays = arrays
+        # deltas only hold the rows that changed, see diff()
+        self.delta = delta
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+
+def _vec(v):
+    return None if v is None else [v.x, v.y]
+
+
+def _pack_emitter(emitter, prefix, arrays):
+    shape_attr, kind = SHAPES[type(emitter.shape)]
+    shape_value = getattr(emitter.shape, shape_attr)
+    buffer = emitter.particles
+    for name in PARTICLE_COLUMNS:
+        arrays[f'{prefix}.{name}'] = getattr(buffer, name)[:buffer.count]
+    return {
+        'pos': _vec(emitter.pos),
+        'vel': _vec(emitter.vel),
+        # the player's emitter is handed a Vector2 here
+        'speed': (_vec(emitter.speed) if isinstance(emitter.speed, Vector2)
+                  else emitter.speed),
+        'spawn_rate': emitter.spawn_rate,
+        'last_spawn': emitter.last_spawn,
+        'age': emitter.age,
+        'active': emitter.active,
+        'deactivate_after_burst': emitter.deactivate_after_burst,
+        'shape': [type(emitter.shape).__name__, kind(shape_value)],
+        'particle_class': emitter.particle_class.__name__,
+        'particle_kwargs': dict(emitter.particle_kwargs),
+        'capacity': buffer.capacity,
+    }
+
+
+def _unpack_emitter(meta, prefix, arrays):
+    shape_name, shape_value = meta['shape']
+    speed = meta['speed']
+    emitter = ParticleEmitter(
+        meta['pos'],
+        spawn_rate=meta['spawn_rate'],
+        speed=Vector2(speed) if isinstance(speed, list) else speed,
+        shape=getattr(ParticleEmitter, shape_name)(shape_value),
+        particle_class=PARTICLE_CLASSES[meta['particle_class']],
+        particle_kwargs=meta['particle_kwargs'],
+        capacity=meta['capacity'],
+    )
+    # the stored velocity is already normalised
+    emitter.vel = None if meta['vel'] is None else Vector2(meta['vel'])
+    emitter.last_spawn = meta['last_spawn']
+    emitter.age = meta['age']
+    emitter.active = meta['active']
+    emitter.deactivate_after_burst = meta['deactivate_after_burst']
+
+    buffer = emitter.particles
+    count = len(arrays[f'{prefix}.age'])
+    buffer.reserve(count)
+    for name in PARTICLE_COLUMNS:
+        getattr(buffer, name)[:count] = arrays[f'{prefix}.{name}']
+    buffer.count = count
+    return emitter
+
+
+def pack(game):
+    arrays = {}
+    registry = game.projectiles
+    for store in registry:
+        prefix = f'projectiles.{store.kind.__name__}'
+        for name in PROJECTILE_COLUMNS:
+            arrays[f'{prefix}.{name}'] = getattr(store, name)[:store.count]
+    arrays['handles.generation'] = registry.generation[:registry.slots]
+    arrays['handles.location'] = registry.location[:registry.slots]
+    arrays['handles.free'] = np.array(registry.free, np.int32)
+
+    player = game.player
+    portals = []
+    for i, portal in enumerate(game.portals):
+        if portal is None:
+            portals.append(None)
+            continue
+        portals.append({
+            'pos': _vec(portal.pos),
+            'width': portal.width,
+            'normal': _vec(portal.normal),
+            'perp': _vec(portal.perp),
+            'exit': _vec(portal.exit),
+            'line': [_vec(end) for end in portal.line],
+            'color': list(portal.color),
+            'active': portal.active,
+            'deactivate_when_empty': portal.deactivate_when_empty,
+            'emitter': _pack_emitter(
+                portal.particle_emitter, f'portal{i}', arrays),
+        })
+
+    version, state, gauss = random.getstate()
+    arrays['random'] = np.array(state, np.uint32)
+
+    meta = {name: getattr(game, name) for name in SCALARS}
+    meta.update({
+        'screen_shake': _vec(game.screen_shake),
+        'camera': _vec(game.camera.pos),
+        'counters': dict(game.counters),
+        'random': [version, gauss],
+        'rng': particles.rng.bit_generator.state,
+        'kinds': [kind.__name__ for kind in registry.kinds],
+        'splits': [list(store.splits) for store in registry],
+        'peak': registry.peak,
+        'player': {
+            'pos': _vec(player.pos),
+            'prev_pos': _vec(player.prev_pos),
+            'vel': _vec(player.vel),
+            'speed': player.speed,
+            'max_health': player.max_health,
+            'health': player.health,
+            'emitter': _pack_emitter(player.emitter, 'player', arrays),
+        },
+        'portals': portals,
+    })
+    # copy out of the live columns, which keep changing after this
+    return Snapshot(meta, {k: v.copy() for k, v in arrays.items()})
+
+
+def unpack(game, snapshot):
+    meta, arrays = snapshot.meta, snapshot.arrays
+    registry = game.projectiles
+    if meta['kinds'] != [kind.__name__ for kind in registry.kinds]:
+        raise ValueError('snapshot was taken with other projectile kinds')
+
+    version, gauss = meta['random']
+    random.setstate((version, tuple(arrays['random'].tolist()), gauss))
+    particles.rng.bit_generator.state = meta['rng']
+
+    if meta['screen_scale'] != game.screen_scale:
+        game.resize_screen(meta['screen_scale'])
+    for name in SCALARS:
+        setattr(game, name, meta[name])
+    game.screen_shake = Vector2(meta['screen_shake'])
+    game.counters = dict(meta['counters'])
+
+    for store, splits in zip(registry, meta['splits']):
+        prefix = f'projectiles.{store.kind.__name__}'
+        count = len(arrays[f'{prefix}.life'])
+        store.reserve(count)
+        for name in PROJECTILE_COLUMNS:
+            getattr(store, name)[:count] = arrays[f'{prefix}.{name}']
+        store.count = count
+        store.splits = list(splits)
+    slots = len(arrays['handles.generation'])
+    registry.reserve(slots)
+    registry.generation[:slots] = arrays['handles.generation']
+    registry.generation[slots:] = 0
+    registry.location[:slots] = arrays['handles.location']
+    registry.location[slots:] = -1
+    registry.slots = slots
+    registry.free = arrays['handles.free'].tolist()
+    registry.peak = meta['peak']
+
+    state = meta['player']
+    player = Player(state['pos'], state['vel'])
+    player.prev_pos = Vector2(state['prev_pos'])
+    player.speed = state['speed']
+    player.max_health = state['max_health']
+    player.health = state['health']
+    player.emitter = _unpack_emitter(state['emitter'], 'player', arrays)
+    player.emitter.pos = player.pos
+    game.player = player
+    game.camera.pos = Vector2(meta['camera'])
+    game.camera.target = player
+    game.update_view()
+
+    # sprites come from the per-class caches, nothing to rebuild here
+    game.portals = []
+    for i, state in enumerate(meta['portals']):
+        if state is None:
+            game.portals.append(None)
+            continue
+        portal = Portal(state['pos'], -Vector2(state['normal']),
+                        state['color'], state['width'])
+        # keep the exact geometry rather than re-deriving it from the normal
+        portal.normal = Vector2(state['normal'])
+        portal.perp = Vector2(state['perp'])
+        portal.exit = Vector2(state['exit'])
+        portal.line = tuple(Vector2(end) for end in state['line'])
+        portal.deactivate_when_empty = state['deactivate_when_empty']
+        portal.particle_emitter = _unpack_emitter(
+            state['emitter'], f'portal{i}', arrays)
+        game.portals.append(portal)
+    game.portal_network.rebuild(game.portals)
+    for portal, state in zip(game.portals, meta['portals']):
+        if portal:
+            portal.active = state['active']
+    game.dirty.invalidate()
+
+
+def diff(base, snapshot):
+    # rows that changed since base; arrays whose shape changed are kept
+    # whole. Applies only to the exact snapshot it was taken against
+    arrays = {}
+    for name, array in snapshot.arrays.items():
+        old = base.arrays.get(name)
+        if old is None or old.shape != array.shape or old.dtype != array.dtype:
+            arrays[name] = array
+            continue
+        changed = array != old
+        if changed.ndim > 1:
+            changed = changed.reshape(len(changed), -1).any(axis=1)
+        rows = np.flatnonzero(changed).astype(np.uint32)
+        arrays[f'{name}@rows'] = rows
+        arrays[name] = array[rows]
+    return Snapshot(snapshot.meta, arrays, delta=True)
+
+
+def apply(base, delta):
+    arrays = {}
+    for name, array in delta.arrays.items():
+        if name.endswith('@rows'):
+            continue
+        rows = delta.arrays.get(f'{name}@rows')
+        if rows is None:
+            arrays[name] = array
+        else:
+            arrays[name] = base.arrays[name].copy()
+            arrays[name][rows] = array
+    return Snapshot(delta.meta, arrays)
+
+
+def write(snapshot, path):
+    layout = {}
+    offset = 0
+    for name, array in snapshot.arrays.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset += array.nbytes
+    header = json.dumps({
+        'meta': snapshot.meta,
+        'arrays': layout,
+        'delta': snapshot.delta,
+    }).encode()
+    start = -(-(HEADER.size + len(header)) // ALIGN) * ALIGN
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        position = HEADER.size + len(header)
+        for name, array in snapshot.arrays.items():
+            at = start + layout[name][2]
+            f.write(bytes(at - position))
+            f.write(np.ascontiguousarray(array).reshape(-1).view(np.uint8))
+            position = at + array.nbytes
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        magic, size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a snapshot')
+        header = json.loads(f.read(size))
+        start = -(-(HEADER.size + size) // ALIGN) * ALIGN
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # arrays are views straight into the mapped file
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(
+            data, dtype, count, start + offset).reshape(shape)
+    return Snapshot(header['meta'], arrays, header['delta'])
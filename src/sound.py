@@ -1,23 +1,208 @@
+import hashlib
+import math
+import os
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
 import pygame
-from pygame import Vector2
 
-from tqdm import tqdm
-from pathlib import Path
+
+class SoundLoader:
+    __slots__ = ['paths', 'cache_dir', 'workers', 'pool', 'futures']
+
+    def __init__(self, directory, extension, cache_dir=None, workers=4):
+        # only the file names are read up front, decoding is deferred
+        self.paths = {
+            path.stem: path for path in Path(directory).rglob(f'*.{extension}')
+        }
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.workers = workers
+        self.pool = None
+        self.futures = {}
+
+    def __contains__(self, name):
+        return name in self.paths
+
+    def warm(self, names=None):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(
+                self.workers, thread_name_prefix='sound')
+        for name in self.paths if names is None else names:
+            if name not in self.futures:
+                self.futures[name] = self.pool.submit(self.load, name)
+
+    def get(self, name):
+        future = self.futures.get(name)
+        if future is None:
+            future = self.futures[name] = Future()
+            future.set_result(self.load(name))
+        return future.result()
+
+    def cache_path(self, path):
+        # decoded PCM depends on the source file and the mixer's format
+        stat = path.stat()
+        key = repr((
+            str(path.resolve()), stat.st_mtime_ns, stat.st_size,
+            pygame.mixer.get_init()
+        ))
+        digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+        return self.cache_dir / f'{path.stem}-{digest}.npy'
+
+    def load(self, name):
+        path = self.paths[name]
+        if self.cache_dir is None:
+            return pygame.mixer.Sound(str(path))
+
+        cached = self.cache_path(path)
+        if cached.exists():
+            return pygame.mixer.Sound(buffer=np.load(cached, mmap_mode='r'))
+
+        sound = pygame.mixer.Sound(str(path))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, pygame.sndarray.array(sound))
+        os.replace(tmp, cached)
+        return sound
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
 
 
 class SoundPlayer:
-    def __init__(self, directory, extension):
-        pygame.mixer.init(buffer=1024)
-        self.cache = {}
+    # requests quieter than this never reach the mixer
+    threshold = .02
+    # a sound is not restarted within this many seconds of its last start
+    window = .05
+    # distance at which positioned sounds fade out completely
+    falloff = 200
+    max_voices = 4
+
+    def __init__(self, directory, extension, enabled=True,
+                 priority=None, voices=None, warm=None, cache_dir=None):
+        self.loader = None
         self.directory = directory
         self.extension = extension
-        for file_name in tqdm(Path(directory).rglob(f'*.{extension}'), desc='Loading sounds'):
-            self.cache[file_name.stem] = pygame.mixer.Sound(str(file_name))
+        self.enabled = enabled
         self.sounds = []
+        self.priority = priority or {}
+        self.voices = voices or {}
+        self.listener = (0, 0)
+        # name -> [volume, pan] of the loudest request this frame
+        self.pending = {}
+        self.started = {}
+        self.channels = []
+        self.playing = []
+        # channels new sounds may start on, None for all of them
+        self.voice_limit = None
+        self.counts = dict.fromkeys(
+            ('requested', 'culled', 'merged', 'limited', 'played'), 0)
+        if not enabled:
+            return
+        pygame.mixer.init(buffer=1024)
+        self.channels = [
+            pygame.mixer.Channel(i)
+            for i in range(pygame.mixer.get_num_channels())
+        ]
+        self.playing = [None] * len(self.channels)
+        self.loader = SoundLoader(directory, extension, cache_dir)
+        if warm:
+            self.loader.warm(warm)
+
+    def close(self):
+        # stops the warm-up pool; sounds already decoded stay usable
+        if self.loader:
+            self.loader.shutdown()
+
+    def busy_channels(self):
+        return sum(channel.get_busy() for channel in self.channels)
+
+    def play(self, sound_name, volume=1, pos=None):
+        if not self.enabled:
+            return
+        self.counts['requested'] += 1
+        pan = 0
+        if pos is not None:
+            dx = pos[0] - self.listener[0]
+            dy = pos[1] - self.listener[1]
+            volume *= max(0, 1 - math.hypot(dx, dy) / self.falloff)
+            pan = max(-1, min(1, dx / self.falloff))
+        self.queue(sound_name, volume, pan, 1)
+
+    def play_at(self, sound_name, positions, volume=1):
+        # many positioned requests for one sound collapse to the loudest
+        if not self.enabled or not len(positions):
+            return
+        self.counts['requested'] += len(positions)
+        offset = np.asarray(positions) - tuple(self.listener)
+        dist = np.hypot(offset[:, 0], offset[:, 1])
+        volumes = volume * np.clip(1 - dist / self.falloff, 0, 1)
+        i = int(volumes.argmax())
+        pan = min(1, max(-1, float(offset[i, 0]) / self.falloff))
+        self.queue(sound_name, float(volumes[i]), pan, len(positions))
+
+    def queue(self, sound_name, volume, pan, requests):
+        if volume < self.threshold:
+            self.counts['culled'] += requests
+            return
+        pending = self.pending.get(sound_name)
+        if pending is None:
+            self.pending[sound_name] = [volume, pan]
+            requests -= 1
+        elif volume > pending[0]:
+            pending[:] = volume, pan
+        self.counts['merged'] += requests
+
+    def flush(self, now):
+        pending, self.pending = self.pending, {}
+        if not self.enabled or not pending:
+            return
+
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                self.playing[i] = None
+
+        order = sorted(
+            pending.items(),
+            key=lambda item: (-self.priority.get(item[0], 0), -item[1][0]))
+        for name, (volume, pan) in order:
+            if now - self.started.get(name, -math.inf) < self.window:
+                self.counts['merged'] += 1
+                continue
+            sound = self.loader.get(name)
+            priority = self.priority.get(name, 0)
+            if sound.get_num_channels() >= self.voices.get(
+                    name, self.max_voices):
+                self.counts['limited'] += 1
+                continue
+            i = self.find_channel(priority)
+            if i is None:
+                self.counts['limited'] += 1
+                continue
+
+            channel = self.channels[i]
+            channel.play(sound)
+            channel.set_volume(volume * min(1, 1 - pan),
+                               volume * min(1, 1 + pan))
+            self.playing[i] = priority
+            self.started[name] = now
+            self.counts['played'] += 1
+
+    def find_channel(self, priority):
+        # a free channel, else the lowest priority voice below this one
+        lowest = None
+        for i, playing in enumerate(self.playing[:self.voice_limit]):
+            if playing is None:
+                return i
+            if playing < priority and (
+                    lowest is None or playing < self.playing[lowest]):
+                lowest = i
+        if lowest is not None:
+            self.channels[lowest].stop()
+        return lowest
 
-    def play(self, sound_name, volume=1):
-        vol = Vector2(volume)
-        sound = self.cache[sound_name]
-        channel = sound.play()
-        if channel:
-            channel.set_volume(*vol.xy)
+    def stats(self):
+        return dict(self.counts)
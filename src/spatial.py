@@ -0,0 +1,125 @@
+import math
+from collections import defaultdict
+
+import pygame
+
+
+class SpatialHash:
+    __slots__ = ['cell_size', 'cells', 'items']
+
+    def __init__(self, cell_size=16):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def cell_keys(self, rect):
+        cs = self.cell_size
+        x0, y0 = rect.left // cs, rect.top // cs
+        x1 = (rect.right - 1) // cs if rect.w > 0 else x0
+        y1 = (rect.bottom - 1) // cs if rect.h > 0 else y0
+        if x0 == x1 and y0 == y1:
+            return ((x0, y0),)
+        return tuple(
+            (x, y)
+            for x in range(x0, x1 + 1)
+            for y in range(y0, y1 + 1)
+        )
+
+    def insert(self, item, rect=None):
+        if item in self.items:
+            self.move(item, rect)
+            return
+        rect = item.rect if rect is None else pygame.Rect(rect)
+        keys = self.cell_keys(rect)
+        for key in keys:
+            self.cells[key].append(item)
+        self.items[item] = (rect, keys)
+
+    def remove(self, item):
+        _, keys = self.items.pop(item)
+        for key in keys:
+            cell = self.cells[key]
+            cell.remove(item)
+            if not cell:
+                del self.cells[key]
+
+    def move(self, item, rect=None):
+        rect = item.rect if rect is None else pygame.Rect(rect)
+        _, old_keys = self.items[item]
+        keys = self.cell_keys(rect)
+        if keys != old_keys:
+            self.remove(item)
+            for key in keys:
+                self.cells[key].append(item)
+        self.items[item] = (rect, keys)
+
+    def clear(self):
+        self.cells.clear()
+        self.items.clear()
+
+    def candidates(self, rect):
+        keys = self.cell_keys(rect)
+        if len(keys) == 1:
+            return self.cells.get(keys[0], ())
+        seen = {}
+        for key in keys:
+            for item in self.cells.get(key, ()):
+                seen[item] = None
+        return seen
+
+    def query_rect(self, rect, exclude=None):
+        rect = pygame.Rect(rect)
+        items = self.items
+        return [
+            item for item in self.candidates(rect)
+            if item is not exclude and items[item][0].colliderect(rect)
+        ]
+
+    def query_radius(self, pos, radius, exclude=None):
+        x, y = pos
+        bounds = pygame.Rect(
+            math.floor(x - radius), math.floor(y - radius),
+            math.ceil(radius * 2) + 1, math.ceil(radius * 2) + 1
+        )
+        items = self.items
+        r2 = radius * radius
+        hits = []
+        for item in self.candidates(bounds):
+            if item is exclude:
+                continue
+            rect = items[item][0]
+            # distance from the circle centre to the closest point of the rect
+            dx = x - min(max(x, rect.left), rect.right)
+            dy = y - min(max(y, rect.top), rect.bottom)
+            if dx * dx + dy * dy <= r2:
+                hits.append(item)
+        return hits
+
+    def query_pairs(self, others=None):
+        if others is not None:
+            return [
+                (other, item)
+                for other in others
+                for item in self.query_rect(other.rect, exclude=other)
+            ]
+
+        items = self.items
+        pairs = {}
+        for cell in self.cells.values():
+            for i, a in enumerate(cell):
+                rect = items[a][0]
+                for b in cell[i + 1:]:
+                    if rect.colliderect(items[b][0]):
+                        # entities spanning cells meet more than once
+                        key = (a, b) if id(a) < id(b) else (b, a)
+                        pairs[key] = None
+        return list(pairs)
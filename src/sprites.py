@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+import pygame
+
+
+caches = []
+
+
+def rotozoom(surf, angle, scale):
+    return pygame.transform.rotozoom(surf, -angle, scale)
+
+
+class SpriteCache:
+    __slots__ = [
+        'name', 'base', 'transform',
+        'angle_step', 'scale_step', 'max_size',
+        'bases', 'entries', 'hits', 'misses'
+    ]
+
+    def __init__(self, name, base, transform=rotozoom,
+                 angle_step=2, scale_step=.05, max_size=4096):
+        self.name = name
+        self.base = base
+        self.transform = transform
+        self.angle_step = angle_step
+        self.scale_step = scale_step
+        self.max_size = max_size
+        self.bases = {}
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        caches.append(self)
+
+    def base_surface(self, variant=None):
+        surf = self.bases.get(variant)
+        if surf is None:
+            surf = self.bases[variant] = self.base(variant)
+        return surf
+
+    def get(self, angle, scale=1, variant=None):
+        angle = round(angle / self.angle_step) * self.angle_step % 360
+        scale = round(scale / self.scale_step)
+        key = (variant, angle, scale)
+
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        surf = self.transform(
+            self.base_surface(variant), angle, scale * self.scale_step)
+        self.entries[key] = surf
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return surf
+
+    def configure(self, angle_step=None, scale_step=None, max_size=None):
+        if angle_step is not None:
+            self.angle_step = angle_step
+        if scale_step is not None:
+            self.scale_step = scale_step
+        if max_size is not None:
+            self.max_size = max_size
+        self.clear()
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'size': len(self.entries),
+        }
+
+
+def stats():
+    return {cache.name: cache.stats() for cache in caches}
+
+
+def configure(**kwargs):
+    for cache in caches:
+        cache.configure(**kwargs)
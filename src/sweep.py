@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def segment_box(p0, p1, lo, hi):
+    # slab test of segments p0 -> p1 against boxes [lo, hi]; returns the
+    # time of impact along each segment, inf where it misses
+    d = p1 - p0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = 1 / d
+        t0 = (lo - p0) * inv
+        t1 = (hi - p0) * inv
+    # axes the segment does not move along must already overlap
+    still = d == 0
+    inside = (lo <= p0) & (p0 <= hi)
+    near = np.where(still, np.where(inside, -np.inf, np.inf),
+                    np.minimum(t0, t1))
+    far = np.where(still, np.where(inside, np.inf, -np.inf),
+                   np.maximum(t0, t1))
+    enter = np.maximum(near.max(axis=-1), 0)
+    leave = np.minimum(far.min(axis=-1), 1)
+    return np.where(enter <= leave, enter, np.inf)
+
+
+def segment_segment(p0, p1, a, b):
+    # (segments, others) grid of where p0 -> p1 crosses a -> b, inf where
+    # it does not; segments lying along the other segment never cross
+    r = (p1 - p0)[:, None, :]
+    s = (b - a)[None, :, :]
+    offset = a[None, :, :] - p0[:, None, :]
+    denom = cross(r, s)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = cross(offset, s) / denom
+        u = cross(offset, r) / denom
+    hit = (denom != 0) & (0 <= t) & (t <= 1) & (0 <= u) & (u <= 1)
+    return np.where(hit, t, np.inf)
+
+
+def ordered_hits(toi):
+    # rows with a hit, ordered by time of impact
+    rows = np.flatnonzero(np.isfinite(toi))
+    rows = rows[np.argsort(toi[rows], kind='stable')]
+    return rows, toi[rows]
+
+
+def first_hits(toi):
+    # rows with any hit ordered by time of impact, and the column hit first
+    column = toi.argmin(axis=1)
+    rows, t = ordered_hits(toi[np.arange(len(toi)), column])
+    return rows, column[rows], t